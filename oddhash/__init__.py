@@ -16,24 +16,30 @@
 name = "oddhash"
 version = "0.0.6"
 
-from lark import Lark, Transformer
+from lark import Lark, Transformer, Tree, Token
 import Crypto.Hash
-import Crypto.Hash.HMAC
+import oddhash.providers
 import pkgutil
 import binascii
+import collections
+import functools
+import itertools
 
 debug = False
 
 __grammar = '''
 ?start: binop
 
-function: algorithm [ "_" RAW ] "(" binop ")"
+function: algorithm [ RAW ] "(" binop ")"
 
-algorithm: [ HMAC "_" ] ALG_NAME [ "_" DIGEST_SIZE ]
+iterated: algorithm [ RAW ] ITERATIONS "(" binop ")"
+
+algorithm: [ HMAC "_" ] ALG_NAME [ DIGEST_SIZE ]
 
 ?binop:  param (OPERATOR binop)?
 
 ?param: function
+      | iterated
       | SALT
       | PASSWORD
       | MESSAGE
@@ -43,18 +49,54 @@ PASSWORD: "$p"
 MESSAGE: "$m"
 
 HMAC: "hmac"
-RAW: "raw"
-DIGEST_SIZE: ("0".."9")+
+RAW: "_raw"
+DIGEST_SIZE: "_" ("0".."9")+
+ITERATIONS: "^" ("0".."9")+
 ALG_NAME: ("a".."z"|"A".."Z"|"0".."9")+
 OPERATOR: "."|"+"
 WHITESPACE: " "+
 %ignore WHITESPACE
 '''
 
-__parser = Lark(__grammar)
+def __strip(token):
+    """The underscore is part of the RAW and DIGEST_SIZE tokens so the
+grammar is LALR(1), it is then dropped from the token values (as is
+the caret of ITERATIONS)."""
+    return token.update(value=token[1:])
 
+@functools.lru_cache(maxsize=None)
 def parser():
-    return __parser
+    """LALR parser of the grammar, the analysis of the grammar is cached
+(by lark in the temporary directory, when supported) as it dominates
+startup time."""
+    options = dict(
+        parser='lalr',
+        lexer_callbacks={
+            'RAW': __strip,
+            'DIGEST_SIZE': __strip,
+            'ITERATIONS': __strip,
+        },
+    )
+    try:
+        return Lark(__grammar, cache=True, **options)
+    except ValueError:
+        # older versions of lark-parser (e.g. 0.8.2 of requirements.txt)
+        # reject unknown options such as cache
+        return Lark(__grammar, **options)
+
+def unparse(tree):
+    "convert a parse tree back into a format specification"
+    if not isinstance(tree, Tree):
+        return str(tree)
+    if tree.data in ('function', 'iterated'):
+        algorithm, *rest = tree.children
+        name = '_'.join(algorithm.children)
+        if rest[0] == 'raw':
+            name += '_raw'
+        if tree.data == 'iterated':
+            name += '^' + rest[-2]
+        return '{}({})'.format(name, unparse(rest[-1]))
+    return ''.join(unparse(x) for x in tree.children)
 
 class OddHashError(Exception):
     pass
@@ -91,18 +133,29 @@ class Hexlify:
     def hexdigest(self):
         return self.data.decode('utf8')
 
-def algorithms():
-    "return a list of hash modules provided by Crypto.Hash"
-    return [
-        m.name
+@functools.lru_cache(maxsize=None)
+def modules():
+    """Index of the hash modules provided by Crypto.Hash, i.e. upper case
+name to module name. Built on first use, as discovering the modules
+is comparatively slow."""
+    return {
+        m.name.upper(): m.name
         for m in pkgutil.iter_modules(Crypto.Hash.__path__)
         if m.name[0] != '_'
-    ]
+    }
+
+def algorithms():
+    "return a list of hash modules provided by Crypto.Hash"
+    return list(modules().values())
 
 
-def bitwise_operation_aux(xs, ys, f):
+def xor(xs, ys, from_bytes=int.from_bytes):
+    """Bitwise xor of equal length byte strings, computed on (arbitrary
+precision) integers so that it runs at C speed instead of per byte."""
     if len(xs) == len(ys):
-        return bytes([f(x,y) for x, y in zip(xs, ys)])
+        return (
+            from_bytes(xs, 'big') ^ from_bytes(ys, 'big')
+        ).to_bytes(len(xs), 'big')
     raise ValueError(
         (
             'bitwise operation with unequal length byte strings '
@@ -110,70 +163,492 @@ def bitwise_operation_aux(xs, ys, f):
         ).format(xs, len(xs), ys, len(ys))
     )
 
-def bitwise_operation(f):
-    "need to consider padding unequal length byte strings"
-    return lambda xs, ys, f=f: bitwise_operation_aux(xs, ys, f)
+def concatenate(a, b):
+    return a + b
+
+def uses(x, name):
+    "check if compiled value x is a function that takes parameter name"
+    return type(x) != bytes and name in x.__code__.co_varnames
+
+# maximum number of salts that results are cached for, when exceeded
+# the cache is emptied
+saltCacheSize = 1 << 16
+
+# minimum total length of the constants of a concatenation for it to be
+# fed to a hash with an update per segment. Building a concatenation is
+# a single copy, which is quicker than an update per segment until the
+# copy is large
+segmentSize = 1 << 16
+
+def segments(a, b):
+    """Flatten the concatenation of compiled values a and b into a list
+of segments, where adjacent constants are joined."""
+    result = list(getattr(a, 'segments', [a]))
+    for x in getattr(b, 'segments', [b]):
+        if result and type(x) == bytes and type(result[-1]) == bytes:
+            result[-1] += x
+        else:
+            result.append(x)
+    return result
+
+def per_salt(f):
+    """Cache the results of f, a function of only the salt. Thus, each
+salt only subexpression is evaluated once per salt."""
+    cache = {}
+    def g(salt, f=f, cache=cache):
+        result = cache.get(salt)
+        if result is None:
+            if len(cache) >= saltCacheSize:
+                cache.clear()
+            result = cache[salt] = f(salt)
+        return result
+    return g
+
+def per_password(f):
+    """Lift f, a function of only the password, to a function of password
+and salt that remembers the last result. As each candidate is checked
+against all salts in turn, password only subexpressions are evaluated
+once per candidate."""
+    last = [None, None]
+    def g(pwd, salt, f=f, last=last):
+        if last[0] is not pwd:
+            # computed first, so if f raises the result is not remembered
+            last[1] = f(pwd)
+            last[0] = pwd
+        return last[1]
+    return g
+
+def backends():
+    "names of the backends supported by HashBuilder"
+    return ['closure', 'codegen']
+
+class BackendMismatchError(OddHashError):
+    def __init__(self, args):
+        self.args = args
+
+    def __str__(self):
+        return 'backends computed different results for {}'.format(
+            self.args)
+
+def cross_check(f, g):
+    """Check two compiled functions compute the same results for a few
+sample inputs, raises BackendMismatchError if not."""
+    if type(f) == bytes or type(g) == bytes:
+        if f != g:
+            raise BackendMismatchError(())
+        return
+    samples = [b'', b'password', bytes(range(256))]
+    repeat = uses(f, 'pwd') + uses(f, 'salt')
+    for args in itertools.product(samples, repeat=repeat):
+        try:
+            expected = g(*args)
+        except Exception as e:
+            expected = type(e)
+        try:
+            result = f(*args)
+        except Exception as e:
+            result = type(e)
+        if result != expected:
+            raise BackendMismatchError(args)
+
+def remember(f):
+    """Remember the last result of f, a function of the password (and
+salt). This is used for subexpressions that occur multiple times in a
+format, so they are evaluated once per candidate. Parameters are
+compared by identity, so they must be immutable (i.e. bytes)."""
+    last = [None, None, None]
+    if uses(f, 'salt'):
+        def g(pwd, salt, f=f, last=last):
+            if last[0] is not pwd or last[1] is not salt:
+                last[0], last[1], last[2] = pwd, salt, f(pwd, salt)
+            return last[2]
+        return g
+    def g(pwd, f=f, last=last):
+        if last[0] is not pwd:
+            last[0], last[2] = pwd, f(pwd)
+        return last[2]
+    return g
 
 class HashBuilder(Transformer):
     """Traverses the parse tree and builds/compiles a hash function that
 computes the desired function. Where possible, eagerly evaluate hashes
 of salts. E.g. md5($s.sha256($s)) will be evaluated during the
 compilation.
+
+When raw is set, the outermost function returns its raw digest (or
+the outermost hex is dropped) so that the compiled function avoids
+hexlifying each result, i.e. hexlify of the result is equal to the
+normal result. If the format does not allow this (e.g. it ends with a
+concatenation) raw is reset to False after transform.
+
+When salted is set, the salt is a parameter of the compiled function
+instead of a constant. That is, f(pwd, salt) is returned for formats
+that use both $p and $s. This allows one compiled function to be used
+with many salts, where subexpressions that only depend on the salt are
+cached per salt.
+
+Functions that occur more than once in the format (e.g. md5($p) in
+sha1(md5($p).md5($p))) are compiled once and their result shared.
+
+The backend selects how the function is built, either "closure" for
+nested closures or "codegen" to generate and exec the source of a
+single function (see oddhash.codegen). The result of codegen is
+checked against the closure backend for a few sample inputs.
     """
 
     def __lookup(self, name, size=None):
         if size:
-            l = [
-                a for a in self.__algorithms
-                if a.upper() == (name + "_" + str(size)).upper()
-            ]
-        else:
-            l = [
-                a for a in self.__algorithms
-                if a.upper() == name.upper()
-            ]
-        if len(l) == 1:
-            return l[0]
-
-    def __init__(self, salt=None, message=None):
+            name = name + "_" + str(size)
+        return modules().get(name.upper())
+
+    def __init__(self, salt=None, message=None, raw=False, salted=False,
+                 backend='closure'):
         if salt and type(salt) != bytes:
             raise TypeError('salt should be bytes')
+        if salt and salted:
+            raise ValueError('salt should not be given when salted')
         self.salt = salt
         if message and type(message) != bytes:
             raise TypeError('message should be bytes')
         self.message = message
+        self.raw = raw
+        self.salted = salted
+        if backend not in backends():
+            raise ValueError('unknown backend "{}"'.format(backend))
+        self.backend = backend
+        self.__password = lambda pwd: pwd
+        self.__salt = lambda salt: salt
+
+    def transform(self, tree):
+        if self.raw:
+            tree = self.__finalRaw(tree)
+        if self.backend == 'codegen':
+            import oddhash.codegen
+            result = oddhash.codegen.generate(self, tree)
+            reference = HashBuilder(
+                self.salt, self.message, salted=self.salted
+            ).transform(tree)
+            cross_check(result, reference)
+            return result
+        self.__shared = []
+        tree = self.__share(tree)
+        return super().transform(tree)
+
+    def transform_many(self, trees):
+        """Compile several formats with the same parameters, returns a list
+of (function, raw) tuples where raw is as above for each format.
+Functions that occur in more than one of the formats (e.g. md5($p) in
+both md5(md5($p)) and sha1(md5($p))) are compiled once and shared by
+all of them, so when the formats are evaluated in turn for a candidate
+the shared result is only computed once. The codegen backend compiles
+each format separately."""
+        raw = self.raw
+        result = []
+        if self.backend == 'codegen':
+            for tree in trees:
+                self.raw = raw
+                result.append((self.transform(tree), self.raw))
+            self.raw = raw
+            return result
+        roots = []
+        for tree in trees:
+            self.raw = raw
+            roots.append(self.__finalRaw(tree) if raw else tree)
+            result.append(self.raw)
+        self.raw = raw
+        self.__shared = []
+        tree = self.__share(Tree('formats', roots))
+        return list(zip(super().transform(tree), result))
+
+    def formats(self, items):
+        return items
+
+    def __share(self, tree):
+        """Common subexpression elimination. Each function that occurs more
+than once in the tree is compiled once and its occurrences replaced
+with a shared node that remembers the result for the last candidate."""
+        if not isinstance(tree, Tree):
+            return tree
+        counts = collections.Counter(
+            t for t in tree.iter_subtrees()
+            if t.data in ('function', 'iterated')
+        )
+        index = {}
+
+        def rewrite(t):
+            if not isinstance(t, Tree):
+                return t
+            if t in index:
+                return Tree('shared', [index[t]])
+            new = Tree(t.data, [rewrite(x) for x in t.children])
+            if counts[t] < 2:
+                return new
+            value = Transformer.transform(self, new)
+            if uses(value, 'pwd'):
+                value = remember(value)
+            if debug:
+                print('[*] sharing {} ({} occurrences)'.format(
+                    unparse(t), counts[t]))
+            index[t] = len(self.__shared)
+            self.__shared.append(value)
+            return Tree('shared', [index[t]])
+
+        return rewrite(tree)
+
+    def shared(self, items):
+        return self.__shared[items[0]]
+
+    def __finalRaw(self, tree):
+        "rewrite tree so the outermost function gives its raw digest"
+        if isinstance(tree, Tree) and tree.data == 'function':
+            algorithm, *rest = tree.children
+            if len(rest) == 1:
+                # including hmac_hex, which is also a Hexlify
+                if 'hex' in algorithm.children:
+                    if isinstance(rest[0], Tree):
+                        return rest[0]
+                else:
+                    return Tree(
+                        'function',
+                        [algorithm, Token('RAW', 'raw'), rest[0]]
+                    )
+        if isinstance(tree, Tree) and tree.data == 'iterated':
+            # only the last round gives its raw digest
+            algorithm, *rest = tree.children
+            if len(rest) == 2 and 'hex' not in algorithm.children:
+                count, param = rest
+                if int(count) > 1:
+                    param = Tree('iterated', [
+                        algorithm,
+                        Token('ITERATIONS', str(int(count) - 1)),
+                        param
+                    ])
+                return Tree(
+                    'function',
+                    [algorithm, Token('RAW', 'raw'), param]
+                )
+        self.raw = False
+        return tree
+
+    def __lift(self, x):
+        "convert a compiled value into a function of password and salt"
+        if type(x) == bytes:
+            return lambda pwd, salt, x=x: x
+        if x is self.__password:
+            return lambda pwd, salt: pwd
+        if not uses(x, 'salt'):
+            return per_password(x)
+        if not uses(x, 'pwd'):
+            return lambda pwd, salt, x=x: x(salt)
+        return x
+
+    def __lift_salt(self, x):
+        "convert a compiled value into a function of salt"
+        if type(x) == bytes:
+            return lambda salt, x=x: x
+        return x
+
+    def __midstate(self, new, prefix, rest, raw):
+        """Build a hash function where the constant (or salt only) prefix
+of its input has already been absorbed into a hash object. For each
+candidate a copy of the hash object is taken and updated with the
+rest of the input."""
+        def absorb(data, new=new):
+            h = new()
+            h.update(data)
+            return h
+
+        if hasattr(rest, 'segments'):
+            salted = type(prefix) != bytes or uses(rest, 'salt')
+            update = self.__updates(rest.segments, salted)
+            if update:
+                finish = self.__finish(raw)
+                if type(prefix) != bytes:
+                    states = per_salt(
+                        lambda salt, prefix=prefix: absorb(prefix(salt))
+                    )
+                    return lambda pwd, salt, s=states, u=update, d=finish: d(
+                        u(s(salt).copy(), pwd, salt)
+                    )
+                state = absorb(prefix)
+                if salted:
+                    return lambda pwd, salt, s=state, u=update, d=finish: d(
+                        u(s.copy(), pwd, salt)
+                    )
+                return lambda pwd, s=state, u=update, d=finish: d(
+                    u(s.copy(), pwd)
+                )
 
-        self.__algorithms = algorithms()
+        if raw:
+            def g(state, data):
+                h = state.copy()
+                h.update(data)
+                return h.digest()
+        else:
+            def g(state, data):
+                h = state.copy()
+                h.update(data)
+                return h.hexdigest().encode('utf-8')
+
+        if type(prefix) == bytes:
+            state = absorb(prefix)
+            if uses(rest, 'salt'):
+                return lambda pwd, salt, g=g, state=state, rest=rest: g(
+                    state, rest(pwd, salt)
+                )
+            return lambda pwd, g=g, state=state, rest=rest: g(state, rest(pwd))
+
+        states = per_salt(lambda salt, prefix=prefix: absorb(prefix(salt)))
+        rest = self.__lift(rest)
+        return lambda pwd, salt, g=g, states=states, rest=rest: g(
+            states(salt), rest(pwd, salt)
+        )
+
+    def __finish(self, raw):
+        "function giving the digest of a hash object, raw or in hex"
+        if raw:
+            return lambda h: h.digest()
+        return lambda h: h.hexdigest().encode('utf-8')
+
+    def __updates(self, segments, salted):
+        """Build a function that feeds the segments of a concatenation to a
+hash object with an update each, instead of building the concatenation.
+Returns None when the constants are shorter than segmentSize in total.
+When salted, the function (and the segments) takes the salt."""
+        if sum(len(x) for x in segments if type(x) == bytes) < segmentSize:
+            return None
+        if debug:
+            print('[*] updating with {} segments'.format(len(segments)))
+        if salted:
+            segments = tuple(
+                x if type(x) == bytes else self.__lift(x) for x in segments
+            )
+            def update(h, pwd, salt, segments=segments):
+                for x in segments:
+                    h.update(x if type(x) == bytes else x(pwd, salt))
+                return h
+            return update
+        segments = tuple(segments)
+        def update(h, pwd, segments=segments):
+            for x in segments:
+                h.update(x if type(x) == bytes else x(pwd))
+            return h
+        return update
+
+    def __keyed(self, f, raw):
+        "function of data and password computing f, an hmac (or hex)"
+        if raw:
+            if hasattr(f, 'digest'):
+                return f.digest
+            return lambda data, pwd, f=f: f(data, pwd).digest()
+        if hasattr(f, 'digest'):
+            return lambda data, pwd, d=f.digest: binascii.hexlify(d(data, pwd))
+        return lambda data, pwd, f=f: f(data, pwd).hexdigest().encode('utf-8')
+
+    def iterated(self, items):
+        """A function applied repeatedly to its own result, e.g. md5^3($p)
+is md5(md5(md5($p))). The first round is compiled as a function, the
+remaining rounds are computed in a single loop that calls the
+constructor of the hash directly."""
+        f, *rest = items
+        raw = rest[0] == 'raw'
+        rounds = int(rest[-2])
+        if rounds < 1:
+            raise ValueError('iterations should be at least 1')
+        first = self.function([f] + rest[:-2] + rest[-1:])
+        if rounds == 1:
+            return first
+
+        if uses(f, 'pwd'):
+            def loop(data, pwd, g=self.__keyed(f, raw), n=rounds - 1):
+                for _ in range(n):
+                    data = g(data, pwd)
+                return data
+            if uses(first, 'salt'):
+                return lambda pwd, salt, first=first, loop=loop: loop(
+                    first(pwd, salt), pwd
+                )
+            return lambda pwd, first=first, loop=loop: loop(first(pwd), pwd)
+
+        if raw:
+            def loop(data, new=f.new, n=rounds - 1):
+                for _ in range(n):
+                    data = new(data).digest()
+                return data
+        else:
+            def loop(data, new=f.new, hexlify=binascii.hexlify, n=rounds - 1):
+                for _ in range(n):
+                    data = hexlify(new(data).digest())
+                return data
+        if type(first) == bytes:
+            return loop(first)
+        if uses(first, 'salt'):
+            if not uses(first, 'pwd'):
+                return per_salt(
+                    lambda salt, first=first, loop=loop: loop(first(salt))
+                )
+            return lambda pwd, salt, first=first, loop=loop: loop(
+                first(pwd, salt)
+            )
+        return lambda pwd, first=first, loop=loop: loop(first(pwd))
 
     def function(self, items):
         f = items.pop(0)
 
         if not 'pwd' in f.__code__.co_varnames:
-            if items[0] == "raw":
-                g = lambda data, f=f: f(data).digest()
+            raw = items[0] == "raw"
+            if raw:
+                g = f.digest
                 items.pop(0)
             else:
-                g = lambda data, f=f: f(data).hexdigest().encode('utf-8')
+                g = lambda data, d=f.digest: binascii.hexlify(d(data))
             param = items.pop(0)
             if type(param) == bytes:
                 return g(param)
+            if hasattr(param, 'prefix') and hasattr(f.new(), 'copy'):
+                if debug:
+                    print('[*] using midstate for prefix')
+                return self.__midstate(f.new, param.prefix, param.rest, raw)
+            if hasattr(param, 'segments') and uses(param, 'pwd'):
+                salted = uses(param, 'salt')
+                update = self.__updates(param.segments, salted)
+                if update:
+                    new, finish = f.new, self.__finish(raw)
+                    if salted:
+                        return lambda pwd, salt, n=new, u=update, d=finish: d(
+                            u(n(), pwd, salt)
+                        )
+                    return lambda pwd, n=new, u=update, d=finish: d(
+                        u(n(), pwd)
+                    )
+            if uses(param, 'salt'):
+                if not uses(param, 'pwd'):
+                    return per_salt(
+                        lambda salt, g=g, param=param: g(param(salt))
+                    )
+                return lambda pwd, salt, g=g, param=param: g(param(pwd, salt))
             return lambda pwd, g=g, param=param: g(param(pwd))
 
         # computation of f is blocked on needing password
+        g = self.__keyed(f, items[0] == "raw")
         if items[0] == "raw":
-            g = lambda data, pwd, f=f: f(data, pwd).digest()
             items.pop(0)
-        else:
-            g = lambda data, pwd, f=f: f(data, pwd).hexdigest().encode('utf-8')
         param = items.pop(0)
         if type(param) == bytes:
             return lambda pwd, g=g, param=param: g(param, pwd)
+        if uses(param, 'salt'):
+            param = self.__lift(param)
+            return lambda pwd, salt, g=g, param=param: g(
+                param(pwd, salt), pwd
+            )
         return lambda pwd, g=g, param=param: g(param(pwd), pwd)
 
     def PASSWORD(self, item):
-        return lambda pwd: pwd
+        return self.__password
 
     def SALT(self, item):
+        if self.salted:
+            return self.__salt
         if not self.salt:
             raise ValueError('salt required but not specified')
         return self.salt
@@ -186,16 +661,39 @@ compilation.
     def OPERATOR(self, item):
         if item[0] == '.':
             # concatenation
-            return lambda a, b: a + b
+            return concatenate
         if item[0] == '+':
             # bitwise xor
-            return bitwise_operation((lambda a, b: a ^ b))
+            return xor
         raise ValueError('operator {} not implemented'.format(item))
 
     def binop(self, items):
         a1, op, a2 = items
+        result = self.__binop(a1, op, a2)
+        if op is concatenate and type(result) != bytes:
+            result.segments = segments(a1, a2)
+        # record when a concatenation starts with a value that does not
+        # depend on the password, so a hash can absorb it once
+        if op is concatenate and not uses(a1, 'pwd') and uses(a2, 'pwd'):
+            if hasattr(a2, 'prefix'):
+                result.prefix = self.__binop(a1, op, a2.prefix)
+                result.rest = a2.rest
+            else:
+                result.prefix = a1
+                result.rest = a2
+        return result
+
+    def __binop(self, a1, op, a2):
         if type(a1) == bytes and type(a2) == bytes:
             return op(a1, a2)
+        if uses(a1, 'salt') or uses(a2, 'salt'):
+            if uses(a1, 'pwd') or uses(a2, 'pwd'):
+                a1, a2 = self.__lift(a1), self.__lift(a2)
+                return lambda pwd, salt, a1=a1, a2=a2, op=op: op(
+                    a1(pwd, salt), a2(pwd, salt)
+                )
+            a1, a2 = self.__lift_salt(a1), self.__lift_salt(a2)
+            return lambda salt, a1=a1, a2=a2, op=op: op(a1(salt), a2(salt))
         if type(a1) == bytes:
             return lambda pwd, a1=a1, a2=a2, op=op: op(a1, a2(pwd))
         if type(a2) == bytes:
@@ -219,11 +717,13 @@ compilation.
         if debug:
             print("[*] looking up: {}".format(name))
 
-        if self.__lookup(name):
-            name = self.__lookup(name)
-        elif items and self.__lookup(name, int(items[0])):
-            name = self.__lookup(name, int(items[0]))
-            del items[0]
+        found = self.__lookup(name)
+        if not found and items:
+            found = self.__lookup(name, int(items[0]))
+            if found:
+                del items[0]
+        if found:
+            name = found
         else:
             if debug:
                 print('[E] algorithm not found:', name, items)
@@ -238,21 +738,27 @@ compilation.
 
         if hmac:
             # not possible to pass digest size as parameter
+            provider, digestmod, digest = oddhash.providers.select_hmac(name, m)
+            import Crypto.Hash.HMAC
             def h(data, pwd, m=m):
                 h = Crypto.Hash.HMAC.new(key=pwd, digestmod=m)
                 h.update(data)
                 return h
+            # expose name of hashlib algorithm, e.g. for code generation
+            h.hmac = digestmod
         else:
-            if items:
-                def h(data, f=m.new, s=int(items[0])):
-                    h = f(digest_bits=s)
-                    h.update(data)
-                    return h
-            else:
-                def h(data, f=m.new):
-                    h = f()
-                    h.update(data)
-                    return h
+            provider, new = oddhash.providers.select(
+                name, m, int(items[0]) if items else None
+            )
+            def h(data, new=new):
+                return new(data)
+            # expose constructor, e.g. for midstates or code generation
+            h.new = new
+            digest = lambda data, new=new: new(data).digest()
+        # expose function computing the raw digest
+        h.digest = digest
+        if debug:
+            print('[*] {} provided by {}'.format(name, provider))
 
         # just check during compile that hash function works
         try:
@@ -269,3 +775,58 @@ compilation.
                 )
             raise AlgorithmTestError(name, items, e)
         return h
+
+class Format:
+    """A compiled hash format, see compile. The compiled function is
+available as function, it is bytes when the format does not depend on
+the password."""
+
+    def __init__(self, format, salt=None, message=None, backend='closure'):
+        self.format = format
+        self.salt = salt
+        self.message = message
+        self.backend = backend
+        self.function = HashBuilder(
+            salt, message, backend=backend
+        ).transform(parser().parse(format))
+
+    def hash(self, pwd):
+        """hash a single password, given as bytes (other buffers, e.g. a
+bytearray, are copied into bytes)"""
+        if type(self.function) == bytes:
+            return self.function
+        # shared subexpressions are remembered by the identity of the
+        # password, so a buffer that is refilled must not be passed on
+        return self.function(bytes(pwd))
+
+    def hash_many(self, passwords):
+        """Hash each password (bytes, as hash) of an iterable, returns an
+iterator over the hashes. Passwords are consumed as the hashes are."""
+        if type(self.function) == bytes:
+            return (self.function for pwd in passwords)
+        return map(self.function, map(bytes, passwords))
+
+    def hash_many_parallel(self, passwords, workers=None, size=1024):
+        """As hash_many, but passwords are hashed in batches of size across
+workers processes (defaults to one per core). Hashes are yielded in
+the same order as the passwords."""
+        import oddhash.pool
+        return oddhash.pool.hashParallel(
+            (self.format, self.salt, self.message, self.backend),
+            map(bytes, passwords),
+            workers,
+            size
+        )
+
+@functools.lru_cache(maxsize=256)
+def compile(format, salt=None, message=None, backend='closure'):
+    """Compile a format specification, e.g. "md5($s.md5($p))", into a
+Format for hashing passwords. Compiled formats are cached, so repeated
+calls with the same parameters do not compile the format again. Raises
+OddHashError (or ValueError) when the format can not be compiled, or a
+lark exception when it can not be parsed.
+
+    >>> oddhash.compile('md5($p)').hash(b'password')
+    b'5f4dcc3b5aa765d61d8327deb882cf99'
+    """
+    return Format(format, salt, message, backend)
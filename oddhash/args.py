@@ -41,6 +41,18 @@ class OddHashHelpFormatter(argparse.HelpFormatter):
             ) + '\n\n'
         return lines
 
+    def _get_help_string(self, action):
+        """Substitute the list of algorithms into help text, which is only
+done when help is displayed as discovering the algorithms is
+comparatively slow."""
+        help = super()._get_help_string(action)
+        if '%(algorithms)s' in help:
+            import oddhash
+            help = help.replace(
+                '%(algorithms)s', ', '.join(oddhash.algorithms())
+            )
+        return help
+
     def _split_lines(self, text, width):
         text=text.strip()
         lines = []
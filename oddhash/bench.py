@@ -0,0 +1,271 @@
+# Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of odd-hash over a fixed corpus of formats, so that the
+performance of versions can be compared.
+
+Each format is compiled and hashed over a generated wordlist with each
+backend in this process, and odd-crack is run over the wordlist (as a
+new process) for a hash that it does not contain. Times are the best of
+a number of repeats, and the results can be saved as json to compare
+with a later run."""
+
+import oddhash
+import oddhash.args as A
+import oddhash.pool as P
+import argparse
+import textwrap
+import subprocess
+import tempfile
+import platform
+import json
+import time
+import sys
+
+# name to tuple of (format, salt, message), the corpus of formats that
+# are measured. Names are used as keys in the json, so should not change
+corpus = {
+    'simple': ('md5($p)', None, None),
+    'salted': ('sha256($s.$p)', b'0123456789abcdef', None),
+    'hmac': ('hmac_sha256($m)', None, b'odd-hash benchmark'),
+    'xor': ('md5($p)+md5($s)', b'salt', None),
+    'deep': ('sha256(md5(sha1(md5($p).$s)).sha1($p))', b'salt', None),
+    'iterated': ('md5^100($p)', None, None),
+    'pycryptodome': ('keccak_256($p)', None, None),
+}
+
+# sections of the results that are measurements, the others (e.g. version
+# and cores) describe the run
+measurements = ('import', 'compile', 'hash', 'crack')
+
+def words(n):
+    "list of n distinct candidate passwords"
+    return [b'word%d' % i for i in range(n)]
+
+def best(f, repeat):
+    "shortest time in seconds of repeat calls of f"
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        elapsed = time.perf_counter() - start
+        result = elapsed if result is None else min(result, elapsed)
+    return result
+
+def importTime(repeat):
+    """Seconds taken to import odd-crack in a new interpreter, less the
+startup time of the interpreter itself."""
+    def run(code):
+        return best(lambda: subprocess.run(
+            [sys.executable, '-c', code], check=True), repeat)
+    return max(0.0, run('import oddhash.crack') - run('pass'))
+
+def compileTime(format, salt, message, backend, repeat):
+    "seconds taken to parse and compile format"
+    return best(lambda: oddhash.HashBuilder(
+        salt, message, backend=backend
+    ).transform(oddhash.parser().parse(format)), repeat)
+
+def hashRate(format, salt, message, backend, passwords, repeat):
+    "candidates hashed per second in this process"
+    f = oddhash.HashBuilder(
+        salt, message, backend=backend
+    ).transform(oddhash.parser().parse(format))
+    return len(passwords) / best(lambda: list(map(f, passwords)), repeat)
+
+def crackRate(format, salt, message, wordlist, count, workers, repeat):
+    """Candidates checked per second by odd-crack (including its startup)
+for a hash that is not in the wordlist."""
+    output = oddhash.compile(format, salt, message).hash(b'')
+    command = [
+        sys.executable, '-m', 'oddhash.crack',
+        '--no-potfile',
+        '--workers', str(workers),
+        format, wordlist, '0' * len(output),
+    ]
+    if salt:
+        command[3:3] = ['--salt', 'hex:' + salt.hex()]
+    if message:
+        command[3:3] = ['--message', 'hex:' + message.hex()]
+    return count / best(lambda: subprocess.run(
+        command, check=True, stdout=subprocess.DEVNULL), repeat)
+
+def flatten(results, prefix=''):
+    "dict of dotted path to value of the numbers in results"
+    flat = {}
+    for key, value in results.items():
+        if type(value) == dict:
+            flat.update(flatten(value, prefix + key + '.'))
+        elif type(value) in (int, float):
+            flat[prefix + key] = value
+    return flat
+
+def compare(old, new, file=sys.stdout):
+    """Print each measurement of new relative to old, as a ratio where
+more than 1 is an improvement (times are inverted)."""
+    old, new = (
+        flatten({k: v for k, v in x.items() if k in measurements})
+        for x in (old, new)
+    )
+    for key in sorted(new):
+        if key not in old or not old[key] or not new[key]:
+            continue
+        ratio = new[key] / old[key]
+        if not key.split('.')[0] in ('hash', 'crack'):
+            ratio = 1 / ratio
+        print('{:<40} {:>12.6g} {:>12.6g} {:>7.2f}x'.format(
+            key, old[key], new[key], ratio), file=file)
+
+def main():
+    parser = argparse.ArgumentParser(description=textwrap.dedent('''
+
+    Benchmark of odd-hash, to compare the performance of different
+    versions. Measures the time to import and compile formats, and the
+    number of candidates per second that are hashed (in process) and
+    cracked (by odd-crack) for a fixed set of formats: {}.
+
+    '''.format(', '.join(corpus))),
+    epilog='''
+    {} v{}.
+    Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+    '''.format(oddhash.name, oddhash.version),
+    formatter_class=A.OddHashHelpFormatter,
+    )
+    parser.add_argument(
+        '--words',
+        type=int,
+        metavar='N',
+        default=100000,
+        help='Number of candidates in the generated wordlist'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        metavar='N',
+        default=len(P.cores()),
+        help=textwrap.dedent('''
+
+        Number of processes odd-crack is measured with (as well as 1),
+        defaults to the number of available cores.
+
+        ''')
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        metavar='N',
+        default=3,
+        help='Repeat each measurement N times and take the best'
+    )
+    parser.add_argument(
+        '--formats',
+        nargs='+',
+        choices=list(corpus),
+        default=list(corpus),
+        metavar='NAME',
+        help='Only measure these formats of the corpus'
+    )
+    parser.add_argument(
+        '--no-crack',
+        action='store_true',
+        help='Do not measure odd-crack, which is the slowest part'
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='Print the results as json, e.g. to be given to --compare'
+    )
+    parser.add_argument(
+        '--compare',
+        type=argparse.FileType('r'),
+        metavar='FILE',
+        help=textwrap.dedent('''
+
+        Compare the results with those of a previous run saved with
+        --json, each measurement is printed with its ratio to the
+        previous where more than 1 is an improvement.
+
+        ''')
+    )
+
+    args = parser.parse_args()
+    if args.words < 1 or args.workers < 1 or args.repeat < 1:
+        parser.error('--words, --workers and --repeat must be at least 1')
+    previous = None
+    if args.compare:
+        with args.compare:
+            try:
+                previous = json.load(args.compare)
+            except ValueError as e:
+                parser.error('invalid results in {}: {}'.format(
+                    args.compare.name, e))
+    log = sys.stderr if args.json else sys.stdout
+
+    results = {
+        'version': oddhash.version,
+        'python': platform.python_version(),
+        'cores': len(P.cores()),
+        'words': args.words,
+        'import': importTime(args.repeat),
+        'compile': {},
+        'hash': {},
+        'crack': {},
+    }
+    print('[*] {} v{}, python {}, {} cores, {} words'.format(
+        oddhash.name, oddhash.version, results['python'], results['cores'],
+        args.words), file=log)
+    print('[*] import {:.1f} ms'.format(1000 * results['import']), file=log)
+
+    passwords = words(args.words)
+    with tempfile.NamedTemporaryFile(suffix='.txt') as wordlist:
+        wordlist.write(b'\n'.join(passwords) + b'\n')
+        wordlist.flush()
+        for name in args.formats:
+            format, salt, message = corpus[name]
+            print('[*] {}: {}'.format(name, format), file=log)
+            compiled = results['compile'][name] = {}
+            hashed = results['hash'][name] = {}
+            for backend in oddhash.backends():
+                compiled[backend] = compileTime(
+                    format, salt, message, backend, args.repeat)
+                hashed[backend] = hashRate(
+                    format, salt, message, backend, passwords, args.repeat)
+            print('    compile {}'.format(', '.join(
+                '{} {:.2f} ms'.format(k, 1000 * v)
+                for k, v in compiled.items())), file=log)
+            print('    hash    {}'.format(', '.join(
+                '{} {:.0f}/s'.format(k, v) for k, v in hashed.items())),
+                file=log)
+            if args.no_crack:
+                continue
+            cracked = results['crack'][name] = {}
+            for workers in sorted({1, args.workers}):
+                cracked[str(workers)] = crackRate(
+                    format, salt, message, wordlist.name, args.words,
+                    workers, args.repeat)
+            print('    crack   {}'.format(', '.join(
+                '{} workers {:.0f}/s'.format(k, v)
+                for k, v in cracked.items())), file=log)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    if previous:
+        print('[*] compared with {} v{}'.format(
+            oddhash.name, previous.get('version')), file=log)
+        compare(previous, results, log)
+
+if __name__ == '__main__':
+    main()
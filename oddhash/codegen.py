@@ -0,0 +1,295 @@
+# Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import oddhash
+import binascii
+import hmac
+from lark import Transformer
+
+class CodeGenerator(Transformer):
+    """Alternative to the nested closures of HashBuilder, generates the
+source of a single flat function that computes the format and compiles
+it with exec. Each node is assigned to a local variable, and identical
+expressions are only computed once.
+
+Values that do not depend on the password are computed during
+generation. In salted mode, values that only depend on the salt are
+computed by a separate prepare function whose results are cached per
+salt.
+
+Nodes are represented either as bytes (constants), tuples of (name,
+pwd) for variables where pwd is True when the variable depends on the
+password, or a list of nodes for a concatenation (so a hash can absorb
+a constant prefix)."""
+
+    def __init__(self, builder):
+        self.builder = builder
+        self.env = {
+            'hexlify': binascii.hexlify,
+            'hmac': hmac.digest,
+            'xor': oddhash.xor,
+        }
+        self.prep = []
+        self.body = []
+        self.exprs = {}
+        self.algorithms = {}
+        self.salt = False
+
+    def __constant(self, value):
+        "name of a constant object in the environment of the function"
+        name = 'k{}'.format(len(self.env))
+        self.env[name] = value
+        return name
+
+    def __emit(self, expr, pwd, *statements):
+        "assign expr to a new local variable, unless already computed"
+        key = (statements, expr)
+        if key not in self.exprs:
+            name = 'v{}'.format(len(self.exprs))
+            code = self.body if pwd else self.prep
+            code.extend(statements)
+            code.append('{} = {}'.format(name, expr))
+            self.exprs[key] = (name, pwd)
+        return self.exprs[key]
+
+    def __segments(self, node):
+        "segments of a concatenation, where adjacent constants are joined"
+        segments = []
+        for x in node:
+            if segments and type(x) == bytes and type(segments[-1]) == bytes:
+                segments[-1] += x
+            else:
+                segments.append(x)
+        return segments
+
+    def __value(self, node):
+        "convert a concatenation into a single value"
+        if type(node) != list:
+            return node
+        segments = self.__segments(node)
+        if len(segments) == 1:
+            return segments[0]
+        return self.__emit(
+            ' + '.join(self.__expr(x) for x in segments),
+            any(self.__pwd(x) for x in segments)
+        )
+
+    def __expr(self, node):
+        "python expression of a value"
+        if type(node) == bytes:
+            return repr(node)
+        return node[0]
+
+    def __pwd(self, node):
+        if type(node) == list:
+            return any(self.__pwd(x) for x in node)
+        return type(node) == tuple and node[1]
+
+    def algorithm(self, items):
+        key = '_'.join(items)
+        if key not in self.algorithms:
+            h = self.builder.algorithm(list(items))
+            new = getattr(h, 'new', None)
+            self.algorithms[key] = (
+                h,
+                self.__constant(h),
+                new and self.__constant(new)
+            )
+        return self.algorithms[key]
+
+    def function(self, items):
+        (h, name, new), *items = items
+        raw = items[0] == 'raw'
+        param = items[-1]
+
+        if raw:
+            digest = '{}.digest()'
+        elif new:
+            digest = 'hexlify({}.digest())'
+        else:
+            digest = '{}.hexdigest().encode(\'utf-8\')'
+
+        if not new:
+            # hmac or hex, needs the password
+            param = self.__value(param)
+            if getattr(h, 'hmac', None):
+                digest = '{}' if raw else 'hexlify({})'
+                return self.__emit(
+                    digest.format('hmac(pwd, {}, {!r})'.format(
+                        self.__expr(param), h.hmac)),
+                    True
+                )
+            return self.__emit(
+                digest.format('{}({}, pwd)'.format(name, self.__expr(param))),
+                True
+            )
+
+        if type(param) == list:
+            param = self.__segments(param)
+            state = None
+            n = 0
+            if hasattr(h.new(), 'copy'):
+                # absorb prefix that does not depend on password
+                while n < len(param) and not self.__pwd(param[n]):
+                    n += 1
+                if 0 < n < len(param):
+                    prefix = self.__value(param[:n])
+                    if type(prefix) == bytes:
+                        state = h.new()
+                        state.update(prefix)
+                        state = self.__constant(state)
+                    else:
+                        state = self.__emit(
+                            '{}({})'.format(new, prefix[0]), False
+                        )[0]
+                else:
+                    n = 0
+            rest = param[n:]
+            constants = sum(len(x) for x in rest if type(x) == bytes)
+            if (len(rest) > 1 and self.__pwd(rest) and
+                    constants >= oddhash.segmentSize):
+                # update with each segment instead of concatenating
+                return self.__emit(
+                    digest.format('_h'),
+                    True,
+                    '_h = {}'.format(
+                        '{}()'.format(new) if state is None
+                        else '{}.copy()'.format(state)
+                    ),
+                    *('_h.update({})'.format(self.__expr(x)) for x in rest)
+                )
+            if state is not None:
+                return self.__emit(
+                    digest.format('_h'),
+                    True,
+                    '_h = {}.copy()'.format(state),
+                    '_h.update({})'.format(self.__expr(self.__value(rest)))
+                )
+
+        param = self.__value(param)
+        if type(param) == bytes:
+            if raw:
+                return h(param).digest()
+            return h(param).hexdigest().encode('utf-8')
+        return self.__emit(
+            digest.format('{}({})'.format(new, param[0])),
+            param[1]
+        )
+
+    def iterated(self, items):
+        (h, name, new), *rest = items
+        raw = rest[0] == 'raw'
+        rounds = int(rest[-2])
+        if rounds < 1:
+            raise ValueError('iterations should be at least 1')
+        first = self.function([items[0]] + rest[:-2] + rest[-1:])
+        if rounds == 1:
+            return first
+        if type(first) == bytes:
+            return self.builder.iterated(
+                [h] + rest[:-2] + [str(rounds - 1), first]
+            )
+
+        # the remaining rounds are computed by a loop
+        if new:
+            step = '{}(_d).digest()'.format(new)
+            if not raw:
+                step = 'hexlify({})'.format(step)
+        elif getattr(h, 'hmac', None):
+            step = 'hmac(pwd, _d, {!r})'.format(h.hmac)
+            if not raw:
+                step = 'hexlify({})'.format(step)
+        else:
+            step = '{}(_d, pwd).{}'.format(
+                name, 'digest()' if raw else 'hexdigest().encode(\'utf-8\')'
+            )
+        return self.__emit(
+            '_d',
+            first[1],
+            '_d = {}'.format(first[0]),
+            'for _ in range({}):'.format(rounds - 1),
+            '    _d = {}'.format(step)
+        )
+
+    def PASSWORD(self, item):
+        return ('pwd', True)
+
+    def SALT(self, item):
+        if self.builder.salted:
+            self.salt = True
+            return ('salt', False)
+        return self.builder.SALT(item)
+
+    def MESSAGE(self, item):
+        return self.builder.MESSAGE(item)
+
+    def OPERATOR(self, item):
+        return self.builder.OPERATOR(item)
+
+    def binop(self, items):
+        a1, op, a2 = items
+        if op is oddhash.concatenate:
+            return (a1 if type(a1) == list else [a1]) + \
+                (a2 if type(a2) == list else [a2])
+        a1, a2 = self.__value(a1), self.__value(a2)
+        if type(a1) == bytes and type(a2) == bytes:
+            return op(a1, a2)
+        return self.__emit(
+            'xor({}, {})'.format(self.__expr(a1), self.__expr(a2)),
+            self.__pwd(a1) or self.__pwd(a2)
+        )
+
+    def generate(self, tree):
+        """Returns the source of the function and its environment, or
+bytes if the format is constant."""
+        result = self.__value(self.transform(tree))
+        if type(result) == bytes:
+            return result, None
+
+        lines = []
+        if self.prep:
+            # values only depending on the salt, cached per salt
+            names = [name for name, pwd in self.exprs.values() if not pwd]
+            lines.append('def prepare(salt):')
+            lines.extend('    ' + x for x in self.prep)
+            lines.append('    return ({},)'.format(', '.join(names)))
+            self.env['cache'] = {}
+
+        params = ['pwd'] if self.__pwd(result) else []
+        if self.salt:
+            params.append('salt')
+        lines.append('def compiled({}):'.format(', '.join(params)))
+        if self.prep:
+            lines.append('    p = cache.get(salt)')
+            lines.append('    if p is None:')
+            lines.append('        if len(cache) >= {}:'.format(
+                oddhash.saltCacheSize))
+            lines.append('            cache.clear()')
+            lines.append('        p = cache[salt] = prepare(salt)')
+            lines.append('    {}, = p'.format(', '.join(names)))
+        lines.extend('    ' + x for x in self.body)
+        lines.append('    return {}'.format(self.__expr(result)))
+        return '\n'.join(lines), self.env
+
+def generate(builder, tree):
+    """Compile tree into a function by generating its source. Returns
+bytes when the format is constant."""
+    source, env = CodeGenerator(builder).generate(tree)
+    if env is None:
+        return source
+    if oddhash.debug:
+        print('[*] generated source:\n{}'.format(source))
+    exec(compile(source, '<{}>'.format(oddhash.unparse(tree)), 'exec'), env)
+    return env['compiled']
@@ -15,39 +15,289 @@
 
 import oddhash
 import oddhash.args as A
+import oddhash.wordlist as W
+import oddhash.pool as P
+import oddhash.rules as R
+import oddhash.mask as M
+import oddhash.session as S
+import oddhash.index as I
+from oddhash.targets import Targets
+from oddhash.potfile import Potfile, defaultPath
 import sys
 import argparse
 import textwrap
-import binascii
 import concurrent.futures
+import multiprocessing
 import signal
 import re
+import hashlib
+import contextlib
+import os
+import time
 
 # used child by processes, needs to be global
 def checkHash(password):
     global hasher
-    global args
+    global targets
     try:
-        result = hasher(password)
-        for h in args.hashes:
-            if type(h) == re.Pattern:
-                if h.search(result.decode('utf8')):
-                    return result
-            else:
-                if h == result:
-                    return h
+        return targets.match(hasher(password))
     except KeyboardInterrupt:
         pass
 
+# used by child processes when hashes have their own salt, returns a
+# list of (salt, hash) hits
+def checkSalted(password):
+    global hasher
+    global salts
+    hits = []
+    for salt, targets in salts:
+        hash = targets.match(hasher(password, salt))
+        if hash:
+            hits.append((salt, hash))
+    return hits
+
+# used by child processes with --formats, returns a list of (index,
+# hash) hits where index is of the format that matched
+def checkFormats(password):
+    global formats
+    hits = []
+    for i, (hasher, targets) in enumerate(formats):
+        hash = targets.match(hasher(password))
+        if hash:
+            hits.append((i, hash))
+    return hits
+
+def checkLines(lines):
+    """Check all candidates generated from the words in lines (i.e. each
+rule applied to each word), returns tuple (count, hits) where hits is
+a list of (password, salt, hash) tuples. Thus, the amount of data
+returned to the parent is proportional to the number of matches. With
+--formats, hashes are not salted and the index of the format that
+matched is given in place of the salt."""
+    global salts
+    global rules
+    global combine
+    global formats
+    if combine is not None:
+        return checkCombined(lines)
+    try:
+        count = 0
+        hits = []
+        for candidates in R.mangle(rules, lines):
+            count += len(candidates)
+            if formats is not None:
+                hits += [
+                    (password, i, hash)
+                    for password in candidates
+                    for i, hash in checkFormats(password)
+                ]
+            elif salts is None:
+                hits += [
+                    (password, None, hash)
+                    for password, hash in zip(
+                        candidates, map(checkHash, candidates)
+                    )
+                    if hash
+                ]
+            else:
+                hits += [
+                    (password, salt, hash)
+                    for password in candidates
+                    for salt, hash in checkSalted(password)
+                ]
+        return count, hits
+    except KeyboardInterrupt:
+        return 0, []
+
+def checkCombined(lines):
+    """Check the concatenation of each word in lines with each word of
+the other wordlist (inherited from the parent). When split, the
+format was compiled with the left word as the salt (see combineTree),
+so the hash state of the left word is reused for each right word."""
+    global hasher
+    global targets
+    global combine
+    words, streamedLeft, split = combine
+    # a generator, as the pairs of a chunk can be many times its size
+    if streamedLeft:
+        pairs = ((left, right) for left in lines for right in words)
+    else:
+        pairs = ((left, right) for right in lines for left in words)
+    try:
+        hits = []
+        if split:
+            for left, right in pairs:
+                hash = targets.match(hasher(right, left))
+                if hash:
+                    hits.append((left + right, None, hash))
+        else:
+            for left, right in pairs:
+                hash = targets.match(hasher(left + right))
+                if hash:
+                    hits.append((left + right, None, hash))
+        return len(lines) * len(words), hits
+    except KeyboardInterrupt:
+        return 0, []
+
+# used by child processes, each reads its own range of the wordlist
+# from the memory map inherited from the parent
+def checkRange(start, end):
+    global wordlist
+    return checkLines(W.lines(wordlist, start, end))
+
+# used by child processes when the wordlist can not be memory mapped
+# (e.g. a pipe), the block of data is sent with the task
+def checkBlock(data):
+    return checkLines(W.lines(data, 0, len(data)))
+
+# used by child processes with --mask, each enumerates its own range of
+# the keyspace so no candidates are sent
+def checkMask(start, end):
+    global mask
+    return checkLines(mask.candidates(start, end))
+
+# used by child processes with --build-index, returns the sorted index
+# records of the words in a range of the wordlist
+def indexRange(start, end):
+    global hasher
+    global wordlist
+    return I.records(
+        map(hasher, W.lines(wordlist, start, end)),
+        W.offsets(wordlist, start, end)
+    )
+
+def buildIndex(path, header, workers):
+    """Hash each word of the (memory mapped) wordlist and write the index
+of the digests to path."""
+    global wordlist
+    writer = I.Writer(path, header)
+    tasks = W.chunks(wordlist)
+    if workers == 1:
+        exe = contextlib.nullcontext()
+        results = ((params, indexRange(*params)) for params in tasks)
+    else:
+        exe = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        results = P.imap(exe, indexRange, tasks, workers * 2)
+    with exe:
+        for (start, end), run in results:
+            writer.add(run)
+            print(
+                '[*] indexed {} words ({:.2f}%)'.format(
+                    writer.count, 100 * end / len(wordlist)),
+                end='\r',
+                flush=True
+            )
+    print('\n[*] merging...')
+    writer.close()
+
+# used as initializer of child processes to bind each to its own core
+def pinWorker(counter, cores):
+    with counter.get_lock():
+        n = counter.value
+        counter.value += 1
+    os.sched_setaffinity(0, {cores[n % len(cores)]})
+
+# used as initializer of child processes, ctrl-c is sent to the whole
+# process group but only the parent handles it (and saves the session)
+def initWorker(counter=None, cores=None):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if counter is not None:
+        pinWorker(counter, cores)
+
+def combineTree(tree):
+    """Rewrite each $p of a format into $s.$p. When compiled with a
+runtime salt, the left word of a combination can be given as the salt
+and the right word as the password. This way, a hash of $p absorbs
+the left word once and uses its midstate for every right word."""
+    if isinstance(tree, oddhash.Token) and tree.type == 'PASSWORD':
+        return oddhash.Tree('binop', [
+            oddhash.Token('SALT', '$s'),
+            oddhash.Token('OPERATOR', '.'),
+            tree
+        ])
+    if isinstance(tree, oddhash.Tree):
+        return oddhash.Tree(tree.data, [combineTree(x) for x in tree.children])
+    return tree
+
+def compileFormats(trees, names, hashes, salt, message, backend):
+    """Compile the formats (parse trees) that can match the hashes, returns
+a list of (hasher, targets) tuples and a list of the names of these
+formats. Formats that can not be compiled, or whose hashes are not
+the length of any of the hashes, are dropped. Functions common to
+the formats are shared, see HashBuilder.transform_many."""
+    matching = []
+    for tree, name in zip(trees, names):
+        try:
+            builder = oddhash.HashBuilder(
+                salt, message, raw=True, backend=backend)
+            hasher = builder.transform(tree)
+            # some formats only fail when hashing, e.g. xor of values of
+            # different lengths
+            size = len(hasher(b'password'))
+        except Exception as e:
+            print('[!] unable to compile {}, skipping:\n{}'.format(name, e))
+            continue
+        if not oddhash.uses(hasher, 'pwd'):
+            print('[!] {} does not use $p, skipping'.format(name))
+            continue
+        targets = Targets(hashes, builder.raw)
+        if not targets.patterns and size not in targets.literals:
+            if oddhash.debug:
+                print('[*] {} can not match any hash, skipping'.format(name))
+            continue
+        matching.append((tree, name))
+    if not matching:
+        return [], []
+    trees, names = zip(*matching)
+    compiled = oddhash.HashBuilder(
+        salt, message, raw=True, backend=backend
+    ).transform_many(trees)
+    return [
+        (hasher, Targets(hashes, raw)) for hasher, raw in compiled
+    ], list(names)
+
 def parseHash(param):
     if param.startswith('regex:'):
         return re.compile(param[6:])
     else:
-        return binascii.hexlify(A.toBytes(param, 'hex'))
+        return A.toBytes(param, 'hex')
+
+__salted = re.compile(
+    '^((?:(?:' + '|'.join(A.codings()) + '):)?[^:]*):(.*)$'
+)
+
+def parseSaltedHash(param):
+    """Parse hash:salt, where the hash and salt can both have a coding
+prefix. Returns tuple of (hash, salt, text) where text is the salt as
+given."""
+    m = __salted.match(param)
+    if not m or param.startswith('regex:'):
+        raise ValueError('expected hash:salt, got "{}"'.format(param))
+    return A.toBytes(m.group(1), 'hex'), A.toBytes(m.group(2)), m.group(2)
+
+def digestHashes(hashes):
+    """sha256 (in hex) of parsed hashes, identifies the hashes of a
+session without storing them in the checkpoint"""
+    h = hashlib.sha256()
+    for entry in hashes:
+        if isinstance(entry, tuple):
+            text = '{}:{}'.format(entry[0].hex(), entry[1].hex())
+        elif isinstance(entry, bytes):
+            text = entry.hex()
+        else:
+            text = 'regex:' + entry.pattern
+        h.update(text.encode('utf-8') + b'\n')
+    return h.hexdigest()
 
 def main():
     global hasher
-    global args
+    global targets
+    global salts
+    global wordlist
+    global rules
+    global mask
+    global combine
+    global formats
     parser = argparse.ArgumentParser(description=textwrap.dedent('''
 
     Configurable password hash cracker. It is designed to be easy to
@@ -102,10 +352,9 @@ def main():
         based algorithms (e.g. sha3, keccak, blake2b).
 
         The following is a list of hash functions available from the
-        installed version of pycryptodome: {}.
+        installed version of pycryptodome: %(algorithms)s.
 
-        '''.format(', '.join(oddhash.algorithms()))
-        )
+        ''')
     )
     parser.add_argument(
         '--salt',
@@ -119,21 +368,216 @@ def main():
         metavar="M",
         help='If needed, specify a message value: $m'
     )
+    parser.add_argument(
+        '--formats',
+        action='store_true',
+        help=textwrap.dedent('''
+
+        Instead of a format, the format argument is a file of formats
+        (one per line) to try in a single pass of the wordlist. Formats
+        whose hashes are not the length of any of the hashes are
+        dropped, and functions of the password that are common to
+        several formats (e.g. md5($p)) are only computed once. Each
+        hash found is reported with the format that matched.
+
+        ''')
+    )
     parser.add_argument(
         'wordlist',
-        type=argparse.FileType('rb'),
-        help='Wordlist to use for cracking'
+        help=textwrap.dedent('''
+
+        Wordlist to use for cracking, or "-" for stdin. With --mask,
+        the mask that defines the candidates.
+
+        ''')
     )
     parser.add_argument(
         '--debug',
         action='store_true',
         help='Increase verbosity of print messages'
     )
+    parser.add_argument(
+        '--backend',
+        choices=oddhash.backends(),
+        default='closure',
+        help=textwrap.dedent('''
+
+        How the format is compiled. Either "closure" to build nested
+        closures or "codegen" to generate the source of a single
+        function, which is faster for deeply nested formats.
+
+        ''')
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        metavar='N',
+        default=len(P.cores()),
+        help=textwrap.dedent('''
+
+        Number of processes used to check passwords, defaults to the
+        number of available cores. When 1, passwords are checked in
+        the main process.
+
+        ''')
+    )
+    parser.add_argument(
+        '--pin',
+        action='store_true',
+        help='Pin each worker process to its own core'
+    )
+    parser.add_argument(
+        '--salted',
+        action='store_true',
+        help=textwrap.dedent('''
+
+        Each hash has its own salt and is given as "hash:salt". All
+        salts are checked in a single pass over the wordlist.
+
+        ''')
+    )
+    parser.add_argument(
+        '--rules',
+        type=argparse.FileType('rb'),
+        metavar='FILE',
+        help=textwrap.dedent('''
+
+        File of hashcat style rules, one per line, applied to each
+        word of the wordlist. Supports the functions : l u c C t TN r
+        d f pN $X ^X [ ] DN iNX oNX sXY @X. Rules are applied by the
+        workers, so the wordlist is not expanded on disk or in ipc.
+
+        ''')
+    )
+    parser.add_argument(
+        '--combine',
+        type=argparse.FileType('rb'),
+        metavar='FILE',
+        help=textwrap.dedent('''
+
+        Combinator attack, each candidate is a word of the wordlist
+        followed by a word of FILE. The smaller of the two is loaded
+        into memory (shared by the workers) and the larger is streamed
+        through the workers, so the combinations are never written.
+
+        ''')
+    )
+    parser.add_argument(
+        '--mask',
+        action='store_true',
+        help=textwrap.dedent('''
+
+        Instead of a wordlist, try every candidate of a hashcat style
+        mask, e.g. "?u?l?l?l?d?d?d?d". Supported character sets are:
+        {}. Use ?? for a literal question mark. Each worker enumerates
+        its own range of the keyspace.
+
+        ''').format(', '.join('?' + x for x in M.charsets()))
+    )
+    parser.add_argument(
+        '--skip',
+        type=int,
+        metavar='N',
+        default=0,
+        help=textwrap.dedent('''
+
+        With --mask, skip the first N candidates of the keyspace. With
+        --limit, allows the keyspace to be split across machines.
+
+        ''')
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        metavar='N',
+        help='With --mask, stop after N candidates of the keyspace'
+    )
+    parser.add_argument(
+        '--session',
+        metavar='FILE',
+        help=textwrap.dedent('''
+
+        Periodically save the progress of the session (position in
+        the wordlist or mask and hashes found) to FILE, and when
+        interrupted with ctrl-c.
+
+        ''')
+    )
+    parser.add_argument(
+        '--restore',
+        action='store_true',
+        help=textwrap.dedent('''
+
+        Continue the session saved in the --session file, the other
+        arguments must be the same as when the session was started.
+
+        ''')
+    )
+    parser.add_argument(
+        '--shard',
+        metavar='i/n',
+        help=textwrap.dedent('''
+
+        Only try the i-th of n (numbered from 1) equal parts of the
+        wordlist (or mask), so a job can be split across several
+        machines without overlap.
+
+        ''')
+    )
+    parser.add_argument(
+        '--build-index',
+        metavar='FILE',
+        help=textwrap.dedent('''
+
+        Hash each word of the wordlist once and write an index of the
+        hashes to FILE, sorted so that hashes can be looked up with
+        --index. Then, any hashes given are looked up. Only for formats
+        that end with a hash and do not use a salt per hash.
+
+        ''')
+    )
+    parser.add_argument(
+        '--index',
+        metavar='FILE',
+        help=textwrap.dedent('''
+
+        Look up the hashes in the index FILE (see --build-index) of
+        the wordlist for the format, instead of hashing the wordlist.
+
+        ''')
+    )
+    parser.add_argument(
+        '--potfile',
+        metavar='FILE',
+        default=defaultPath(),
+        help=textwrap.dedent('''
+
+        File that cracked hashes are appended to, defaults to
+        %(default)s. Hashes already in FILE (for the same format, salt
+        and message) are not cracked again.
+
+        ''')
+    )
+    parser.add_argument(
+        '--no-potfile',
+        action='store_true',
+        help='Do not read or write the potfile'
+    )
+    parser.add_argument(
+        '--show',
+        action='store_true',
+        help=textwrap.dedent('''
+
+        Print the hashes that are in the potfile and exit, nothing is
+        cracked. The wordlist is not given, i.e. all arguments after
+        the format are hashes.
+
+        ''')
+    )
     parser.add_argument(
         'hashes',
         metavar='HASH',
-        nargs='+',
-        type=parseHash,
+        nargs='*',
         help=textwrap.dedent('''
 
         List of base16 (i.e. hex) hashes to attempt to crack. Caution,
@@ -146,73 +590,547 @@ def main():
         If a hash starts with "regex:" then it is used to match
         against computed hashes. All comparisons are done in lowercase
         hex. E.g. "regex:^0e\d+$" to find a hash vulnerable to php
-        type juggling.
+        type juggling. Hex digits the expression starts (^) or ends
+        ($) with are checked before the expression is searched, so
+        such searches are quicker.
+
+        With --salted, each hash is given as "hash:salt" where the
+        salt also supports the prefixes, e.g. "base64:AQI=:hex:0304".
 
         ''')
     )
 
     args = parser.parse_args()
     oddhash.debug = args.debug
-
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.pin and not hasattr(os, 'sched_setaffinity'):
+        parser.error('--pin is not supported on this platform')
+    if args.salted and args.salt:
+        parser.error('--salt can not be used with --salted')
+    if args.show:
+        if args.no_potfile:
+            parser.error('--show can not be used with --no-potfile')
+        args.hashes.insert(0, args.wordlist)
+    elif not args.hashes and not args.build_index:
+        parser.error('the following arguments are required: HASH')
+    if args.build_index or args.index:
+        if args.build_index and args.index:
+            parser.error('--build-index can not be used with --index')
+        if (args.salted or args.formats or args.combine or args.rules or
+                args.mask or args.session):
+            parser.error(
+                '--build-index and --index can not be used with --salted, '
+                '--formats, --combine, --rules, --mask or --session')
     try:
-        tree = oddhash.parser().parse(args.format)
-    except Exception as e:
-        print('[E] unable to parse hash format specification:\n', e)
-        return
+        if args.salted:
+            args.hashes = [parseSaltedHash(h) for h in args.hashes]
+        else:
+            args.hashes = [parseHash(h) for h in args.hashes]
+    except (ValueError, re.error) as e:
+        parser.error('invalid hash: {}'.format(e))
+    # before hashes in the potfile are removed, as a restored session
+    # has the hashes it found in the potfile
+    digest = digestHashes(args.hashes)
+    if args.formats and (args.salted or args.combine):
+        parser.error('--formats can not be used with --salted or --combine')
 
-    if args.debug:
-        print(tree.pretty())
+    if args.formats:
+        try:
+            with open(args.format) as f:
+                specs = [
+                    x.strip() for x in f
+                    if x.strip() and not x.startswith('#')
+                ]
+        except (OSError, UnicodeError) as e:
+            parser.error('unable to read formats: {}'.format(e))
+        trees = []
+        for spec in specs:
+            try:
+                trees.append(oddhash.parser().parse(spec))
+            except Exception as e:
+                print('[!] unable to parse format "{}", skipping:\n{}'.format(
+                    spec, e))
+        if not trees:
+            print('[E] no formats found in {}'.format(args.format))
+            return
+    else:
+        try:
+            tree = oddhash.parser().parse(args.format)
+        except Exception as e:
+            print('[E] unable to parse hash format specification:\n', e)
+            return
+        trees = [tree]
 
-    try:
-        hasher = oddhash.HashBuilder(args.salt, args.message).transform(tree)
-    except Exception as e:
-        print('[E] unable compile hash function:\n{}'.format(e))
-        return
+    potfile = None
+    if not args.no_potfile:
+        try:
+            potfile = Potfile(args.potfile)
+        except OSError as e:
+            parser.error('unable to read potfile: {}'.format(e))
+    # hashes are recorded against the normalised format, so that the
+    # same format written differently is found
+    names = [oddhash.unparse(x).lower() for x in trees]
+
+    def solved(entry):
+        "tuple (password, display) of a hash in the potfile, or None"
+        if args.salted:
+            hash, salt, text = entry
+            display = '{}:{}'.format(hash.hex(), text)
+        elif isinstance(entry, bytes):
+            hash, salt = entry, args.salt
+            display = hash.hex()
+        else:
+            # regular expressions are never solved
+            return None
+        for name in names:
+            password = potfile.lookup(name, salt, args.message, hash.hex())
+            if password is not None:
+                if args.formats:
+                    display += ' using ' + name
+                return password.decode('latin-1'), display
+
+    if potfile:
+        remaining = []
+        for entry in args.hashes:
+            hit = solved(entry)
+            if hit is None:
+                if not args.show:
+                    remaining.append(entry)
+            elif args.show:
+                print('{}={}'.format(*hit))
+            elif args.debug:
+                print('[*] found in potfile {}={}'.format(*hit))
+        if args.show:
+            return
+        if len(remaining) < len(args.hashes):
+            print('[*] {} hashes found in potfile, use --show to display'.format(
+                len(args.hashes) - len(remaining)))
+        if not remaining and not args.build_index:
+            print('[*] all hashes found in potfile')
+            return
+        args.hashes = remaining
+
+    if args.combine and (args.mask or args.rules or args.salted):
+        parser.error('--combine can not be used with --mask, --rules or --salted')
+    if args.restore and not args.session:
+        parser.error('--restore requires --session')
+    shard = None
+    if args.shard:
+        try:
+            shard = S.parseShard(args.shard)
+        except ValueError as e:
+            parser.error('invalid shard: {}'.format(e))
+    # a session can only be restored by the same job
+    job = {
+        'format': args.format,
+        'formats': args.formats,
+        'wordlist': args.wordlist,
+        'combine': args.combine and args.combine.name,
+        'rules': args.rules and args.rules.name,
+        'mask': args.mask,
+        'skip': args.skip,
+        'limit': args.limit,
+        'shard': args.shard,
+        'salt': args.salt and args.salt.hex(),
+        'message': args.message and args.message.hex(),
+        'backend': args.backend,
+        'hashes': digest,
+    }
+    checkpoint = None
+    if args.restore:
+        try:
+            checkpoint = S.load(args.session)
+        except (OSError, ValueError) as e:
+            parser.error('unable to restore session: {}'.format(e))
+        if checkpoint.get('job') != job:
+            parser.error('session {} was started with different arguments'.format(
+                args.session))
+    mask = None
+    if args.mask:
+        try:
+            mask = M.Mask(args.wordlist)
+        except ValueError as e:
+            parser.error('invalid mask: {}'.format(e))
+    else:
+        if args.skip or args.limit is not None:
+            parser.error('--skip and --limit require --mask')
+        try:
+            args.wordlist = argparse.FileType('rb')(args.wordlist)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+    if args.skip < 0 or (args.limit is not None and args.limit < 1):
+        parser.error('--skip must not be negative and --limit positive')
+    rules = None
+    if args.rules:
+        with args.rules:
+            try:
+                rules = R.load(args.rules)
+            except ValueError as e:
+                parser.error('invalid rule: {}'.format(e))
+        if not rules:
+            parser.error('no rules found in {}'.format(args.rules.name))
+        if args.debug:
+            print('[*] loaded {} rules'.format(len(rules)))
+
+    # with a combinator attack, the left word is given as a salt when the
+    # format does not otherwise use a salt. Not possible with hmac, as
+    # its key is the whole password
+    split = bool(args.combine) and not any(tree.scan_values(
+        lambda t: isinstance(t, oddhash.Token) and t.type in ('SALT', 'HMAC')))
+    if split:
+        tree = combineTree(tree)
+
+    formats = None
+    if args.formats:
+        formats, names = compileFormats(
+            trees, names, args.hashes, args.salt, args.message, args.backend)
+        if not formats:
+            print('[E] none of the formats can match the hashes')
+            return
+        print('[*] trying {} of {} formats'.format(len(formats), len(trees)))
+        hasher = None
+        salts = None
+        # the workers match against the targets of each format, these
+        # are used by the parent to know when all hashes are found
+        targets = Targets(args.hashes, True)
+    else:
+        if args.debug:
+            print(tree.pretty())
+
+        try:
+            # compare raw digests when possible, this avoids hexlifying
+            # the result of each candidate
+            builder = oddhash.HashBuilder(
+                None if split else args.salt,
+                args.message,
+                raw=True,
+                salted=args.salted or split,
+                backend=args.backend
+            )
+            hasher = builder.transform(tree)
+        except Exception as e:
+            print('[E] unable compile hash function:\n{}'.format(e))
+            return
 
-    if type(hasher) == bytes:
-        print('[!] salt only hash, no point continuing')
+        if not oddhash.uses(hasher, 'pwd'):
+            print('[!] salt only hash, no point continuing')
+            return
+
+        if args.debug:
+            print('[*] comparing {} digests'.format(
+                'raw' if builder.raw else 'hex'))
+
+        if args.salted:
+            if not oddhash.uses(hasher, 'salt'):
+                print('[E] hashes are salted, but format does not use $s')
+                return
+            # group the hashes by salt, so each candidate is only hashed
+            # once per distinct salt
+            targets = None
+            groups = {}
+            saltText = {}
+            for hash, salt, text in args.hashes:
+                groups.setdefault(salt, Targets(raw=builder.raw)).add(hash)
+                saltText[salt] = text
+            salts = list(groups.items())
+            if args.debug:
+                print('[*] loaded {} distinct salts'.format(len(salts)))
+        else:
+            targets = Targets(args.hashes, builder.raw)
+            salts = None
+
+    if args.build_index or args.index:
+        if not builder.raw:
+            print('[E] an index requires a format that ends with a hash')
+            return
+        # e.g. hex($s.$p) ends with a hash, but its length depends on $p
+        size = len(hasher(b''))
+        if any(len(hasher(x)) != size for x in (b'x', b'password')):
+            print('[E] an index requires a format with a fixed length')
+            return
+        try:
+            wordlist = W.mapFile(args.wordlist)
+        except (ValueError, OSError) as e:
+            print('[E] unable to memory map wordlist:\n{}'.format(e))
+            return
+        if wordlist is None:
+            print('[E] an index requires the wordlist to be a file')
+            return
+        # the index can only be used for the same format and wordlist
+        header = {
+            'format': names[0],
+            'salt': (args.salt or b'').hex(),
+            'message': (args.message or b'').hex(),
+            'wordlist': len(wordlist),
+            'digest': size,
+        }
+        if args.build_index:
+            print('[*] building index of {}'.format(args.wordlist.name))
+            try:
+                buildIndex(args.build_index, header, args.workers)
+            except OSError as e:
+                print('[E] unable to write index:\n{}'.format(e))
+                return
+        try:
+            index = I.Index(args.build_index or args.index)
+        except (OSError, ValueError) as e:
+            print('[E] unable to read index:\n{}'.format(e))
+            return
+        if any(index.header.get(k) != v for k, v in header.items()):
+            print('[E] index is not of this format, salt, message and wordlist')
+            return
+        if args.build_index or args.debug:
+            print('[*] index of {} words'.format(len(index)))
+        if not args.hashes:
+            return
+
+        ctr = 0
+        for hash in args.hashes:
+            if type(hash) != bytes:
+                print('[!] unable to look up regex in an index, skipping')
+                continue
+            offset = index.lookup(hash)
+            if offset is None:
+                continue
+            password = W.line(wordlist, offset)
+            # the index is only tied to the wordlist by its size, so the
+            # word is checked in case the wordlist has been changed
+            if hasher(password) != hash:
+                print('[!] index does not match wordlist, has it changed?')
+                continue
+            ctr += 1
+            print('[*] found \x1B[92m{}={}\x1B[39m'.format(
+                password.decode('latin-1'), hash.hex()))
+            if potfile:
+                potfile.add(names[0], args.salt, args.message, hash.hex(),
+                            password)
+        print('[*] done, found {} of {} hashes'.format(ctr, len(args.hashes)))
         return
 
-    print('[*] loading file...')
-    # Using ProcessPoolExecutor is easy way to get concurrent
-    # execution, but the tradeoff is that there are lots of
-    # inefficiencies with the ipc using pickling. However, it appears
-    # approx 40% faster on my 4 core laptop than using a single core.
+    def solve(hex):
+        "with --formats, hash (in hex) is no longer a target of any format"
+        try:
+            digest = bytes.fromhex(hex)
+        except ValueError:
+            # matched a regular expression, so remains a target
+            return
+        targets.found(digest)
+        for _, x in formats:
+            x.found(digest if x.raw else hex.encode())
+
+    def unhex(found, hex):
+        "hash as saved (in hex, see Targets.hex) as compared by found"
+        return bytes.fromhex(hex) if found.raw else hex.encode()
+
+    cracked = []
+    if checkpoint:
+        cracked = checkpoint['found']
+        for entry in cracked:
+            if formats is not None:
+                solve(entry['hash'])
+                continue
+            hex = entry['hash']
+            if entry['salt'] is None:
+                targets.found(unhex(targets, hex))
+                continue
+            salt = bytes.fromhex(entry['salt'])
+            if salt in groups:
+                groups[salt].found(unhex(groups[salt], hex))
+                if not groups[salt]:
+                    del groups[salt]
+        print('[*] restored session, {} hashes found previously'.format(
+            len(cracked)))
+        if not (targets if salts is None else groups):
+            print('[*] all hashes found previously')
+            return
+
+    if mask:
+        first = args.skip
+        last = len(mask) if args.limit is None else min(
+            len(mask), args.skip + args.limit)
+        if shard:
+            first, last = S.shard(first, last, *shard)
+        start = checkpoint['position'] if checkpoint else first
+        if args.debug:
+            print('[*] keyspace of mask is {}'.format(len(mask)))
+        print('[*] trying candidates {} to {} of mask'.format(first, last))
+        wordlist = None
+        combine = None
+        source = contextlib.nullcontext()
+    else:
+        print('[*] loading file...')
+        combine = None
+        if args.combine:
+            # stream the larger wordlist, stdin is always streamed
+            left, right = args.wordlist, args.combine
+            leftSize, rightSize = W.size(left), W.size(right)
+            streamedLeft = leftSize is None or (
+                rightSize is not None and leftSize >= rightSize)
+            loaded, args.wordlist = (
+                (right, left) if streamedLeft else (left, right))
+            with loaded:
+                combine = (W.read(loaded), streamedLeft, split)
+            if args.debug:
+                print('[*] loaded {} words of {} wordlist'.format(
+                    len(combine[0]), 'right' if streamedLeft else 'left'))
+        try:
+            wordlist = W.mapFile(args.wordlist)
+        except (ValueError, OSError) as e:
+            print('[E] unable to memory map wordlist:\n{}'.format(e))
+            return
+        source = args.wordlist
+        if wordlist is None:
+            if shard:
+                print('[E] --shard requires the wordlist to be a file')
+                return
+            first = last = None
+            start = checkpoint['position'] if checkpoint else 0
+            W.skip(args.wordlist, start)
+        else:
+            first, last = 0, len(wordlist)
+            if shard:
+                first, last = (
+                    W.boundary(wordlist, x)
+                    for x in S.shard(first, last, *shard)
+                )
+            start = checkpoint['position'] if checkpoint else first
+
+    # The wordlist is memory mapped before the workers are forked, so
+    # only (start, end) offsets are sent to the workers which then read
+    # the lines directly. Each worker returns only the hits and the
+    # number of candidates tried, so ipc is minimal. When the wordlist
+    # is a stream, blocks of lines are sent instead.
     #
     # todo: look into other concurrent execution methods
-    with concurrent.futures.ProcessPoolExecutor(max_workers=4) as exe:
-        with args.wordlist as f:
-            lines = [ line.rstrip(b'\r\n') for line in f.readlines() ]
-        results = exe.map(checkHash, lines, chunksize=1000)
+    if mask:
+        tasks = mask.ranges(start, last)
+        worker = checkMask
+    elif wordlist is None:
+        tasks = ((block,) for block in W.blocks(args.wordlist))
+        worker = checkBlock
+    else:
+        tasks = W.chunks(wordlist, W.chunkSize, start, last)
+        worker = checkRange
 
+    if args.workers == 1:
+        # avoid the cost of starting processes and ipc
+        exe = contextlib.nullcontext()
+        results = ((params, worker(*params)) for params in tasks)
+    else:
+        initargs = ()
+        if args.pin:
+            initargs = (multiprocessing.Value('i', 0), P.cores())
+        exe = concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=initWorker,
+            initargs=initargs
+        )
+        results = P.imap(exe, worker, tasks, args.workers * 2)
+
+    if args.debug:
+        print('[*] using {} workers'.format(args.workers))
+
+    def progress(params):
+        "how far through the wordlist or keyspace, after task params"
+        if first is None or last == first:
+            return ''
+        return ' ({:.2f}%)'.format(100 * (params[1] - first) / (last - first))
+
+    ctr = checkpoint['tried'] if checkpoint else 0
+    position = start
+
+    def save():
+        if args.session:
+            S.save(args.session, {
+                'job': job,
+                'position': position,
+                'tried': ctr,
+                'found': cracked,
+            })
+
+    with source, exe:
         def handler(signum, frame):
             print('ctrl-c')
+            save()
+            if args.session:
+                print('[*] session saved, continue with --restore')
             sys.exit(1)
         signal.signal(signal.SIGINT, handler)
 
-        ctr = 0
-        print('[*] tried 0', end='\r', flush=True)
-        for password, hash in zip(lines, results):
-            ctr += 1;
-            if ctr % 1000 == 0:
-                print('[*] tried {}'.format(ctr), end='\r', flush=True)
-            if hash:
+        due = time.monotonic() + S.interval
+        print('[*] tried {}'.format(ctr), end='\r', flush=True)
+        for params, (count, hits) in results:
+            ctr += count
+            # results are in order, so all candidates before position
+            # have been tried
+            if worker is checkBlock:
+                position += len(params[0])
+            else:
+                position = params[1]
+            print(
+                '[*] tried {}{}'.format(ctr, progress(params)),
+                end='\r',
+                flush=True
+            )
+            for password, salt, hash in hits:
+                candidate = password
                 try:
                     password = password.decode('latin-1')
                 except:
                     if debug:
                         print('[!] check encoding')
+                name, key = names[0], salt
+                if salt is None:
+                    found = targets
+                    display = targets.hex(hash)
+                elif formats is not None:
+                    # the salt is the index of the format that matched
+                    found, name, key = formats[salt][1], names[salt], None
+                    display = '{} using {}'.format(found.hex(hash), name)
+                else:
+                    found = groups.get(salt, Targets(raw=builder.raw))
+                    display = '{}:{}'.format(found.hex(hash), saltText[salt])
                 print('[*] found \x1B[92m{}={}\x1B[39m'.format(
-                password, hash.decode('utf-8')))
+                password, display))
 
-                try:
-                    args.hashes.remove(hash)
-                except ValueError:
+                if not found.found(hash):
                     print('[!] same hash found multiple times!!')
-                if not args.hashes:
-                    print('[*] all hashes found, shutdown requested')
-                    results.close()
-                    break
+                    continue
+                if formats is not None:
+                    solve(found.hex(hash))
+                    cracked.append({
+                        'password': password,
+                        'hash': found.hex(hash),
+                        'salt': None,
+                        'format': name,
+                    })
+                else:
+                    cracked.append({
+                        'password': password,
+                        'hash': found.hex(hash),
+                        'salt': None if key is None else key.hex(),
+                    })
+                if potfile:
+                    potfile.add(
+                        name,
+                        args.salt if key is None else key,
+                        args.message,
+                        found.hex(hash),
+                        candidate
+                    )
+                if key is not None and not found:
+                    del groups[salt]
+            if args.session and time.monotonic() >= due:
+                save()
+                due = time.monotonic() + S.interval
+            if not (targets if salts is None else groups):
+                print('[*] all hashes found, shutdown requested')
+                results.close()
+                break
+        save()
+    if potfile:
+        potfile.close()
     print('[*] done, tried {} passwords'.format(ctr))
 
 if __name__ == '__main__':
@@ -0,0 +1,132 @@
+# Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Index of the hashes of the words of a wordlist for a format, so that
+hashes can be looked up without hashing the wordlist again.
+
+The file starts with a header (a line of json) that records what was
+indexed (format, salt, message, size of the wordlist and digest), and
+is followed by fixed size records sorted by digest. Each record is a
+raw digest followed by the offset of its word in the wordlist (8 bytes,
+big endian). The records are memory mapped and searched by bisection."""
+
+import heapq
+import json
+import mmap
+import os
+import tempfile
+
+version = 1
+
+def records(digests, offsets):
+    "sorted records (as a single bytes) of the digests of words at offsets"
+    return b''.join(sorted(
+        d + o.to_bytes(8, 'big') for d, o in zip(digests, offsets)
+    ))
+
+class Writer:
+    """Builds an index from runs of sorted records. The runs are written
+to a temporary file as they are added and then merged into the index,
+so the index does not need to fit into memory."""
+
+    def __init__(self, path, header):
+        self.path = path
+        self.header = dict(header, version=version)
+        self.size = header['digest'] + 8
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.spill = tempfile.TemporaryFile(dir=self.directory)
+        self.runs = []
+        self.count = 0
+
+    def add(self, run):
+        "add a run of sorted records, e.g. from records"
+        if run:
+            start = self.spill.tell()
+            self.spill.write(run)
+            self.runs.append((start, start + len(run)))
+            self.count += len(run) // self.size
+
+    def __merged(self, data):
+        size = self.size
+        return heapq.merge(*(
+            (data[i:i + size] for i in range(start, end, size))
+            for start, end in self.runs
+        ))
+
+    def close(self):
+        """Merge the runs and write the index, the index is replaced
+atomically (i.e. it is either the previous or new index)."""
+        self.spill.flush()
+        fd, temp = tempfile.mkstemp(dir=self.directory, prefix='.oddhash-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                header = dict(self.header, count=self.count)
+                f.write(json.dumps(header).encode('utf-8') + b'\n')
+                if self.runs:
+                    with mmap.mmap(
+                        self.spill.fileno(), 0, access=mmap.ACCESS_READ
+                    ) as data:
+                        f.writelines(self.__merged(data))
+            os.replace(temp, self.path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+        finally:
+            self.spill.close()
+
+class Index:
+    "A memory mapped index written by Writer"
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            line = f.readline()
+            try:
+                self.header = json.loads(line)
+            except ValueError:
+                raise ValueError('{} is not an index'.format(path)) from None
+            if (type(self.header) != dict or
+                    self.header.get('version') != version):
+                raise ValueError('{} is not an index (version {})'.format(
+                    path, version))
+            self.start = len(line)
+            self.digest = self.header['digest']
+            self.size = self.digest + 8
+            self.count = self.header['count']
+            if os.fstat(f.fileno()).st_size != (
+                    self.start + self.count * self.size):
+                raise ValueError('{} is truncated'.format(path))
+            self.data = b''
+            if self.count:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, digest):
+        "offset of a word in the wordlist with the digest, or None"
+        if len(digest) != self.digest:
+            return None
+        data, start, size = self.data, self.start, self.size
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = start + mid * size
+            if data[i:i + self.digest] < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        i = start + lo * size
+        if lo < self.count and data[i:i + self.digest] == digest:
+            return int.from_bytes(data[i + self.digest:i + size], 'big')
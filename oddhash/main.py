@@ -15,9 +15,60 @@
 
 import oddhash
 import oddhash.args as A
+import oddhash.wordlist as W
 import sys
 import argparse
 import textwrap
+import binascii
+
+def saltedLine(line):
+    """Split a line of a salted batch into (password, salt, text), where
+the salt is given after the last tab and can have a coding prefix."""
+    password, tab, text = line.rpartition(b'\t')
+    if not tab:
+        raise ValueError('expected password<TAB>salt, got {}'.format(line))
+    return password, A.toBytes(text.decode('utf-8')), text
+
+def batchHash(hash):
+    """The hash as written in a batch. Hashes that are not utf8, or that
+contain a tab or line ending, (e.g. of md5_raw) are written in hex with
+the "hex:" prefix so that the lines can still be split."""
+    try:
+        hash.decode('utf-8')
+    except UnicodeError:
+        return b'hex:' + binascii.hexlify(hash)
+    if any(c in hash for c in b'\t\r\n'):
+        return b'hex:' + binascii.hexlify(hash)
+    return hash
+
+def hashBatch(func, f, out, salted=False, raw=False):
+    """Hash each line of f as a password, writing password<TAB>hash lines
+to out. When salted, each line is password<TAB>salt and the lines
+written are password<TAB>salt<TAB>hash. Lines are processed (and
+written) a block at a time. Unless raw, hashes are written with
+batchHash."""
+    if not raw:
+        func = lambda *params, f=func: batchHash(f(*params))
+    data = W.mapFile(f)
+    if data is None:
+        blocks = W.blocks(f)
+    else:
+        blocks = (data[start:end] for start, end in W.chunks(data))
+
+    for block in blocks:
+        lines = W.lines(block, 0, len(block))
+        if salted:
+            result = []
+            for line in lines:
+                password, salt, text = saltedLine(line)
+                result.append(b'\t'.join(
+                    (password, text, func(password, salt))
+                ))
+        else:
+            result = [password + b'\t' + func(password) for password in lines]
+        result.append(b'')
+        out.write(b'\n'.join(result))
+    out.flush()
 
 def main():
     parser = argparse.ArgumentParser(description=textwrap.dedent('''
@@ -71,9 +122,9 @@ def main():
         based algorithms (e.g. sha3, keccak, blake2b).
 
         The following is a list of hash functions available from the
-        installed version of pycryptodome: {}.
+        installed version of pycryptodome: %(algorithms)s.
 
-        '''.format(', '.join(oddhash.algorithms())))
+        ''')
     )
     parser.add_argument(
         '--salt',
@@ -90,22 +141,68 @@ def main():
     parser.add_argument(
         'password',
         type=A.toBytes,
+        nargs='?',
         help='The password to hash'
     )
+    parser.add_argument(
+        '--batch',
+        type=argparse.FileType('rb'),
+        metavar='FILE',
+        help=textwrap.dedent('''
+
+        Instead of a single password, hash each line of FILE (use "-"
+        for stdin). The format is compiled once and "password<TAB>hash"
+        is written for each line. Hashes that are not utf8 (e.g. of
+        md5_raw) are written in hex with the "hex:" prefix, unless
+        --raw is given.
+
+        ''')
+    )
+    parser.add_argument(
+        '--salted',
+        action='store_true',
+        help=textwrap.dedent('''
+
+        With --batch, each line is "password<TAB>salt" where the salt
+        can have a coding prefix, and "password<TAB>salt<TAB>hash" is
+        written for each line.
+
+        ''')
+    )
     parser.add_argument(
         '--debug',
         action='store_true',
         help='Increase verbosity of print messages'
     )
+    parser.add_argument(
+        '--backend',
+        choices=oddhash.backends(),
+        default='closure',
+        help=textwrap.dedent('''
+
+        How the format is compiled. Either "closure" to build nested
+        closures or "codegen" to generate the source of a single
+        function, which is faster for deeply nested formats.
+
+        ''')
+    )
     parser.add_argument(
         '--raw',
         action='store_true',
         help='Dont try and convert hash to utf8 before printing.'
     )
 
-    args = parser.parse_args()
+    # intermixed, as the password is optional and can be after options
+    args = parser.parse_intermixed_args()
     oddhash.debug = args.debug
 
+    if (args.password is None) == (args.batch is None):
+        parser.error('either a password or --batch is required')
+    if args.salted and not args.batch:
+        parser.error('--salted requires --batch')
+    if args.salted and args.salt:
+        parser.error('--salt can not be used with --salted')
+
     try:
         tree = oddhash.parser().parse(args.format)
     except Exception as e:
@@ -116,7 +213,12 @@ def main():
         print(tree.pretty())
 
     try:
-        func = oddhash.HashBuilder(args.salt, args.message).transform(tree)
+        func = oddhash.HashBuilder(
+            args.salt,
+            args.message,
+            salted=args.salted,
+            backend=args.backend
+        ).transform(tree)
     except Exception as e:
         print('[E] unable compile hash function:\n{}'.format(e))
         return
@@ -129,6 +231,20 @@ def main():
             print('[!] raw hash: {}'.format(func))
         return
 
+    if args.batch:
+        if args.salted:
+            if not oddhash.uses(func, 'salt'):
+                print('[E] format does not use the salt')
+                return
+            if not oddhash.uses(func, 'pwd'):
+                func = lambda pwd, salt, f=func: f(salt)
+        try:
+            hashBatch(
+                func, args.batch, sys.stdout.buffer, args.salted, args.raw)
+        except (ValueError, UnicodeError) as e:
+            print('[E] unable to hash batch:\n{}'.format(e))
+        return
+
     hash = func(args.password)
     if not args.raw:
         try:
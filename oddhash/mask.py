@@ -0,0 +1,121 @@
+# Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import string
+
+# number of candidates in each range of the keyspace handed to a worker
+chunkSize = 1 << 16
+
+# maximum number of candidates of the tail table, see Mask
+tailSize = 1 << 12
+
+__charsets = {
+    'l': string.ascii_lowercase,
+    'u': string.ascii_uppercase,
+    'd': string.digits,
+    'h': '0123456789abcdef',
+    'H': '0123456789ABCDEF',
+    's': ' ' + string.punctuation,
+    'a': string.ascii_lowercase + string.ascii_uppercase + string.digits +
+         ' ' + string.punctuation,
+}
+
+def charsets():
+    "names of the built in character sets"
+    return [x for x in __charsets] + ['b']
+
+def parse(mask):
+    """Split a hashcat style mask into a list of the characters (as a
+list of bytes) of each position. E.g. ?u?l?l?d, where ?? is a literal
+question mark and ?b is any byte."""
+    positions = []
+    i = 0
+    while i < len(mask):
+        c = mask[i]
+        i += 1
+        if c != '?':
+            positions.append([c.encode('utf-8')])
+            continue
+        if i >= len(mask):
+            raise ValueError('mask "{}" ends with ?'.format(mask))
+        name = mask[i]
+        i += 1
+        if name == '?':
+            positions.append([b'?'])
+        elif name == 'b':
+            positions.append([bytes([x]) for x in range(256)])
+        elif name in __charsets:
+            positions.append([x.encode('ascii') for x in __charsets[name]])
+        else:
+            raise ValueError('unknown character set "?{}"'.format(name))
+    if not positions:
+        raise ValueError('empty mask')
+    return positions
+
+class Mask:
+    """Keyspace of a mask, where each candidate has an index in the range
+0 to len(mask). The first position varies slowest, so a range of
+indexes is a run of candidates that can be enumerated independently
+of the rest of the keyspace.
+
+To enumerate quickly, the trailing positions of the mask (up to
+tailSize candidates) are expanded into a table once. A candidate is
+then the head for index // len(tail) followed by the entry of the
+table for index % len(tail)."""
+
+    def __init__(self, mask):
+        self.mask = mask
+        positions = parse(mask)
+        split = len(positions)
+        size = 1
+        while split > 0 and size * len(positions[split - 1]) <= tailSize:
+            split -= 1
+            size *= len(positions[split])
+        self.head = positions[:split]
+        self.tail = [b''.join(x) for x in itertools.product(*positions[split:])]
+        self.size = size
+        for p in self.head:
+            self.size *= len(p)
+
+    def __len__(self):
+        return self.size
+
+    def prefix(self, n):
+        "the head of the candidates with index n * len(tail) onwards"
+        result = []
+        for p in reversed(self.head):
+            n, i = divmod(n, len(p))
+            result.append(p[i])
+        return b''.join(reversed(result))
+
+    def candidates(self, start, end):
+        "list of the candidates with index in range start to end"
+        tail = self.tail
+        result = []
+        while start < end:
+            n, i = divmod(start, len(tail))
+            j = min(len(tail), i + end - start)
+            prefix = self.prefix(n)
+            result += [prefix + t for t in tail[i:j]]
+            start += j - i
+        return result
+
+    def ranges(self, start=0, end=None, size=chunkSize):
+        "yield (start, end) ranges that cover the indexes start to end"
+        end = self.size if end is None else min(end, self.size)
+        while start < end:
+            yield start, min(start + size, end)
+            start += size
@@ -0,0 +1,78 @@
+# Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import oddhash
+import concurrent.futures
+import collections
+import itertools
+import os
+
+def imap(exe, fn, iterable, depth):
+    """Similar to Executor.map, except that only depth tasks are submitted
+ahead of the results being consumed. Thus the iterable is never
+completely loaded into memory. Yields tuples of (params, result)."""
+    pending = collections.deque()
+    try:
+        for params in iterable:
+            pending.append((params, exe.submit(fn, *params)))
+            if len(pending) >= depth:
+                params, future = pending.popleft()
+                yield params, future.result()
+        while pending:
+            params, future = pending.popleft()
+            yield params, future.result()
+    finally:
+        for params, future in pending:
+            future.cancel()
+
+def cores():
+    "list of cores this process is allowed to run on"
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+def batches(iterable, size):
+    "split iterable into lists of (at most) size items"
+    iterable = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterable, size))
+        if not batch:
+            return
+        yield batch
+
+# used as initializer of child processes, compiled functions can not
+# be sent to the children so each compiles the format itself
+def initFormat(*args):
+    global format
+    format = oddhash.compile(*args)
+
+# used by child processes
+def hashBatch(passwords):
+    global format
+    return list(format.hash_many(passwords))
+
+def hashParallel(args, passwords, workers=None, size=1024):
+    """Hash passwords with the format compiled from args (i.e. the
+parameters of oddhash.compile) across workers processes, in batches of
+size passwords. Yields the hashes in order."""
+    workers = workers or len(cores())
+    with concurrent.futures.ProcessPoolExecutor(
+            workers,
+            initializer=initFormat,
+            initargs=args) as exe:
+        tasks = ((batch,) for batch in batches(passwords, size))
+        for _, hashes in imap(exe, hashBatch, tasks, workers * 2):
+            yield from hashes
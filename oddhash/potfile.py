@@ -0,0 +1,87 @@
+# Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+import os
+
+def defaultPath():
+    return os.path.join(os.path.expanduser('~'), '.oddhash.pot')
+
+class Potfile:
+    """Cracked hashes, kept in an append only file so they are not
+cracked again. Each line is
+
+    format<TAB>salt<TAB>message<TAB>hash<TAB>password
+
+where format is normalised (see oddhash.unparse), hash is the hash in
+lowercase hex (as displayed by odd-crack) and the salt, message and
+password are in hex as they can contain any byte. The file is indexed
+when loaded by (format, salt, message) and then hash."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        self.file = None
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    self.__load(line)
+        except FileNotFoundError:
+            pass
+
+    def __load(self, line):
+        fields = line.rstrip(b'\r\n').split(b'\t')
+        if len(fields) != 5:
+            return
+        try:
+            format = fields[0].decode('utf-8')
+            salt, message, password = (
+                binascii.unhexlify(x) for x in fields[1:3] + fields[4:]
+            )
+            hash = fields[3].decode('ascii').lower()
+        except (UnicodeError, ValueError):
+            return
+        self.index.setdefault((format, salt, message), {})[hash] = password
+
+    def lookup(self, format, salt, message, hash):
+        "the password of hash (in hex), or None if not cracked"
+        entries = self.index.get((format, salt or b'', message or b''))
+        if entries:
+            return entries.get(hash.lower())
+
+    def add(self, format, salt, message, hash, password):
+        "record the password of hash (in hex)"
+        salt, message, hash = salt or b'', message or b'', hash.lower()
+        entries = self.index.setdefault((format, salt, message), {})
+        if entries.get(hash) == password:
+            return
+        entries[hash] = password
+        if self.file is None:
+            self.file = open(self.path, 'ab')
+        # each entry is a single write, so concurrent sessions appending
+        # to the same file do not interleave lines
+        self.file.write(b'\t'.join([
+            format.encode('utf-8'),
+            binascii.hexlify(salt),
+            binascii.hexlify(message),
+            hash.encode('ascii'),
+            binascii.hexlify(password),
+        ]) + b'\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
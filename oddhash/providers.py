@@ -0,0 +1,113 @@
+# Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Selects the implementation (provider) of each hash algorithm.
+
+Algorithms are named after the modules of Crypto.Hash, however, for
+short inputs the hash objects of hashlib (i.e. OpenSSL) are noticeably
+cheaper to create and update. So where hashlib implements the same
+algorithm it is used, otherwise PyCryptodome is used (e.g. for keccak
+or MD2). The hashlib implementation is only selected after checking
+it agrees with PyCryptodome on a sample input."""
+
+import hashlib
+import hmac
+import functools
+
+# names of the hashlib algorithms equivalent to the modules of Crypto.Hash
+__hashlib = {
+    'MD4': 'md4',
+    'MD5': 'md5',
+    'SHA': 'sha1',
+    'SHA1': 'sha1',
+    'SHA224': 'sha224',
+    'SHA256': 'sha256',
+    'SHA384': 'sha384',
+    'SHA512': 'sha512',
+    'SHA3_224': 'sha3_224',
+    'SHA3_256': 'sha3_256',
+    'SHA3_384': 'sha3_384',
+    'SHA3_512': 'sha3_512',
+    'RIPEMD': 'ripemd160',
+    'RIPEMD160': 'ripemd160',
+    'BLAKE2b': 'blake2b',
+    'BLAKE2s': 'blake2s',
+}
+
+__sample = (b'oddhash', b'password')
+
+def pycryptodome(module, bits=None):
+    """Constructor of module from Crypto.Hash that takes the data as its
+only (optional) positional parameter."""
+    if bits:
+        return lambda data=b'', f=module.new, s=bits: f(data=data, digest_bits=s)
+    try:
+        module.new(b'')
+    except TypeError:
+        # e.g. keccak only accepts keyword arguments
+        return lambda data=b'', f=module.new: f(data=data)
+    return module.new
+
+def openssl(name, bits=None):
+    "constructor of algorithm name from hashlib, or None when not available"
+    name = __hashlib.get(name)
+    if not name:
+        return None
+    if name.startswith('blake2'):
+        if bits:
+            return functools.partial(getattr(hashlib, name), digest_size=bits // 8)
+        return getattr(hashlib, name)
+    if name in hashlib.algorithms_guaranteed:
+        return getattr(hashlib, name)
+    if name in hashlib.algorithms_available:
+        return functools.partial(hashlib.new, name)
+    return None
+
+def __agrees(f, g):
+    "check two hash functions compute the same digest, errors disagree"
+    try:
+        return f(*__sample) == g(*__sample)
+    except Exception:
+        return False
+
+def select(name, module, bits=None):
+    """Returns a tuple (provider, new) of the name of the provider and
+the constructor of hash objects for the algorithm from module name of
+Crypto.Hash (with optional digest size in bits). The constructor takes
+the data as its only (optional) positional parameter."""
+    reference = pycryptodome(module, bits)
+    new = openssl(name, bits)
+    if new and __agrees(
+            lambda data, pwd, new=new: new(data).digest(),
+            lambda data, pwd, new=reference: new(data).digest()):
+        return 'hashlib', new
+    return 'pycryptodome', reference
+
+def select_hmac(name, module):
+    """Returns a tuple (provider, digestmod, digest) for the hmac of the
+algorithm from module name of Crypto.Hash. Where digest(data, pwd)
+returns the raw hmac keyed with pwd, and digestmod is the name of the
+hashlib algorithm (for hmac.digest) or None."""
+    import Crypto.Hash.HMAC
+    def reference(data, pwd, m=module):
+        return Crypto.Hash.HMAC.new(key=pwd, msg=data, digestmod=m).digest()
+
+    digestmod = __hashlib.get(name)
+    if digestmod and openssl(name):
+        def digest(data, pwd, d=hmac.digest, n=digestmod):
+            return d(pwd, data, n)
+        if __agrees(digest, reference):
+            return 'hashlib', digestmod, digest
+    return 'pycryptodome', None, reference
@@ -0,0 +1,126 @@
+# Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Subset of the hashcat (and john) rule language for mangling words
+of a wordlist into candidate passwords.
+
+A rule is a sequence of functions applied in turn to a word, spaces
+between functions are ignored. Positions (N) are 0-9 and A-Z (i.e.
+10-35), X and Y are single characters:
+
+    :    do nothing
+    l    lowercase
+    u    uppercase
+    c    capitalise, i.e. uppercase first and lowercase the rest
+    C    lowercase first and uppercase the rest
+    t    toggle case of all characters
+    TN   toggle case of character at position N
+    r    reverse
+    d    duplicate
+    f    reflect, i.e. append reversed word
+    pN   append N copies of the word
+    $X   append X
+    ^X   prepend X
+    [    delete first character
+    ]    delete last character
+    DN   delete character at position N
+    iNX  insert X at position N
+    oNX  overwrite character at position N with X
+    sXY  replace all X with Y
+    @X   remove all X
+
+Positions beyond the end of the word leave it unchanged."""
+
+# function name to tuple of (parameters, factory), where parameters
+# is a string of N (position) or X (character) and factory is called
+# with the parameters to give a function of the word
+__functions = {
+    b':': ('', lambda: lambda w: w),
+    b'l': ('', lambda: bytes.lower),
+    b'u': ('', lambda: bytes.upper),
+    b'c': ('', lambda: bytes.capitalize),
+    b'C': ('', lambda: lambda w: w[:1].lower() + w[1:].upper()),
+    b't': ('', lambda: bytes.swapcase),
+    b'T': ('N', lambda n: lambda w: w[:n] + w[n:n + 1].swapcase() + w[n + 1:]),
+    b'r': ('', lambda: lambda w: w[::-1]),
+    b'd': ('', lambda: lambda w: w + w),
+    b'f': ('', lambda: lambda w: w + w[::-1]),
+    b'p': ('N', lambda n: lambda w: w * (n + 1)),
+    b'$': ('X', lambda x: lambda w: w + x),
+    b'^': ('X', lambda x: lambda w: x + w),
+    b'[': ('', lambda: lambda w: w[1:]),
+    b']': ('', lambda: lambda w: w[:-1]),
+    b'D': ('N', lambda n: lambda w: w[:n] + w[n + 1:]),
+    b'i': ('NX', lambda n, x: lambda w: w[:n] + x + w[n:] if n <= len(w) else w),
+    b'o': ('NX', lambda n, x: lambda w: w[:n] + x + w[n + 1:] if n < len(w) else w),
+    b's': ('XX', lambda x, y: lambda w: w.replace(x, y)),
+    b'@': ('X', lambda x: lambda w: w.replace(x, b'')),
+}
+
+def __position(c):
+    try:
+        return int(c.decode('ascii'), 36)
+    except (UnicodeError, ValueError):
+        raise ValueError('invalid position "{}"'.format(c)) from None
+
+def parse(rule):
+    "compile a rule (bytes) into a function of a word"
+    functions = []
+    i = 0
+    while i < len(rule):
+        name = rule[i:i + 1]
+        i += 1
+        if name == b' ':
+            continue
+        if name not in __functions:
+            raise ValueError('unknown rule function "{}" in {}'.format(
+                name.decode('latin-1'), rule))
+        parameters, factory = __functions[name]
+        if i + len(parameters) > len(rule):
+            raise ValueError('missing parameter of "{}" in {}'.format(
+                name.decode('latin-1'), rule))
+        values = []
+        for kind in parameters:
+            c = rule[i:i + 1]
+            i += 1
+            values.append(__position(c) if kind == 'N' else c)
+        functions.append(factory(*values))
+
+    if len(functions) == 1:
+        return functions[0]
+    def apply(word, functions=tuple(functions)):
+        for f in functions:
+            word = f(word)
+        return word
+    return apply
+
+def load(f):
+    """Compile the rules in a (binary) file, one per line. Empty lines
+and lines starting with # are ignored."""
+    rules = []
+    for line in f:
+        line = line.rstrip(b'\r\n')
+        if line and not line.startswith(b'#'):
+            rules.append(parse(line))
+    return rules
+
+def mangle(rules, words):
+    """Yield a list of candidates for each rule, i.e. the rule applied to
+every word. Without rules the words are the candidates."""
+    if not rules:
+        yield words
+        return
+    for rule in rules:
+        yield list(map(rule, words))
@@ -0,0 +1,68 @@
+# Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Checkpoints of odd-crack sessions, so a session can be restored
+after it is interrupted.
+
+A checkpoint is a json object that records what is being cracked
+(format, wordlist or mask, shard), how far the session got (position
+is the byte offset in the wordlist or index in the keyspace of the
+mask, before which all candidates have been tried) and the hashes
+found so far."""
+
+import json
+import os
+import tempfile
+
+# seconds between checkpoints
+interval = 10
+
+def save(path, checkpoint):
+    """Write checkpoint to path atomically, i.e. the file at path is
+either the previous or new checkpoint even if interrupted."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.oddhash-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(checkpoint, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+def load(path):
+    "read a checkpoint written by save"
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if type(checkpoint) != dict or 'position' not in checkpoint:
+        raise ValueError('{} is not a session checkpoint'.format(path))
+    return checkpoint
+
+def parseShard(param):
+    "parse i/n into tuple (i, n), where shards are numbered from 1"
+    try:
+        i, n = (int(x) for x in param.split('/'))
+    except ValueError:
+        raise ValueError('expected i/n, got "{}"'.format(param)) from None
+    if not 1 <= i <= n:
+        raise ValueError('shard {} is not between 1 and {}'.format(i, n))
+    return i, n
+
+def shard(start, end, i, n):
+    "the part of the range start to end that shard i of n covers"
+    size = end - start
+    return start + size * (i - 1) // n, start + size * i // n
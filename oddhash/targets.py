@@ -0,0 +1,153 @@
+# Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import binascii
+
+__hexdigits = '0123456789abcdef'
+
+# bytes whose hex is two decimal digits
+__decimal = bytes(x for x in range(256) if x >> 4 < 10 and x & 15 < 10)
+
+__magic = re.compile(r'^\^0e(\\d|\[0-9\])\+\$$')
+
+def __prefix(source):
+    "hex digits that a match of source (anchored with ^) starts with"
+    if not source.startswith('^'):
+        return ''
+    i = 1
+    while i < len(source) and source[i] in __hexdigits:
+        i += 1
+    if i < len(source) and source[i] in '*+?{':
+        # the last digit is optional or repeated
+        i -= 1
+    return source[1:i]
+
+def __suffix(source):
+    "hex digits that a match of source (anchored with $) ends with"
+    if not source.endswith('$') or source.endswith('\\$'):
+        return ''
+    i = len(source) - 1
+    while i > 0 and source[i - 1] in __hexdigits:
+        i -= 1
+    if i > 0 and source[i - 1] == '\\':
+        # an escape, e.g. \d
+        i += 1
+    elif i > 1 and source[i - 2] == '\\':
+        # digits of an escape, e.g. \x0a
+        return ''
+    return source[i:-1]
+
+def prefilter(pattern, raw):
+    """Build a function that quickly rejects the results (raw digests when
+raw is set, otherwise hex) that can not match pattern, without decoding
+them or searching the regular expression. The literal hex digits that
+a match must start (with ^) or end (with $) with are checked, and
+"^0e\\d+$" (i.e. php magic hashes) is checked completely. Returns None
+when nothing can be checked, e.g. the pattern uses alternation."""
+    source = pattern.pattern
+    if (type(source) != str or '|' in source or
+            pattern.flags & (re.IGNORECASE | re.VERBOSE)):
+        return None
+    prefix, suffix = __prefix(source), __suffix(source)
+
+    if __magic.match(source):
+        if raw:
+            return lambda r, d=__decimal: (
+                r.startswith(b'\x0e') and len(r) > 1 and
+                not r[1:].translate(None, d)
+            )
+        return lambda r: r.startswith(b'0e') and r[2:].isdigit()
+
+    if raw:
+        # digits of a raw digest are in pairs, an odd digit at the start
+        # is the high nibble of the next byte and at the end is ignored
+        head = bytes.fromhex(prefix[:len(prefix) & ~1])
+        tail = bytes.fromhex(suffix[len(suffix) & 1:])
+        if len(prefix) & 1:
+            return lambda r, h=head, n=int(prefix[-1], 16), k=len(head), t=tail: (
+                r.startswith(h) and len(r) > k and r[k] >> 4 == n and
+                r.endswith(t)
+            )
+    else:
+        head, tail = prefix.encode(), suffix.encode()
+    if head and tail:
+        return lambda r, h=head, t=tail: r.startswith(h) and r.endswith(t)
+    if head:
+        return lambda r, h=head: r.startswith(h)
+    if tail:
+        return lambda r, t=tail: r.endswith(t)
+    return None
+
+class Targets:
+    """Hashes that are being cracked. Literal hashes are kept in a set per
+length, so checking a candidate costs a single lookup regardless of
+how many are loaded. Regular expressions are kept in a list and
+checked in turn.
+
+Literal hashes are given as binary digests. When raw is set, the
+candidates are raw digests and are compared as is, otherwise the
+candidates (and hence targets) are in hex.
+
+Each regular expression has a prefilter (when possible), so most
+candidates are rejected without searching the expression."""
+
+    def __init__(self, hashes=(), raw=False):
+        self.raw = raw
+        self.literals = {}
+        self.patterns = []
+        self.checks = []
+        for h in hashes:
+            self.add(h)
+
+    def add(self, h):
+        if type(h) == re.Pattern:
+            self.patterns.append(h)
+            self.checks.append((prefilter(h, self.raw), h))
+        else:
+            if not self.raw:
+                h = binascii.hexlify(h)
+            self.literals.setdefault(len(h), set()).add(h)
+
+    def hex(self, result):
+        "result as a hex string, i.e. how it is displayed and searched"
+        if self.raw:
+            result = binascii.hexlify(result)
+        return result.decode('utf8')
+
+    def match(self, result):
+        "returns result if it is a target, otherwise None"
+        literals = self.literals.get(len(result))
+        if literals and result in literals:
+            return result
+        for check, p in self.checks:
+            if (check is None or check(result)) and p.search(self.hex(result)):
+                return result
+
+    def found(self, result):
+        """Record that result was found. Literal hashes are removed, as
+they do not need to be searched for again. Returns False if result is
+not (or no longer) a target."""
+        literals = self.literals.get(len(result))
+        if literals and result in literals:
+            literals.remove(result)
+            if not literals:
+                del self.literals[len(result)]
+            return True
+        s = self.hex(result)
+        return any(p.search(s) for p in self.patterns)
+
+    def __len__(self):
+        return sum(len(x) for x in self.literals.values()) + len(self.patterns)
@@ -0,0 +1,111 @@
+# Copyright (C) 2021 Karim Kanso. All Rights Reserved.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import mmap
+import os
+import stat
+
+# number of bytes in each range of the wordlist handed to a worker,
+# a range is extended to the next newline so it can be larger
+chunkSize = 1 << 16
+
+def mapFile(f):
+    """Memory map an open file read only. Returns None when the file is
+not a regular file (e.g. stdin), in which case it should be read with
+blocks."""
+    st = os.fstat(f.fileno())
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    if st.st_size == 0:
+        # not possible to map zero bytes
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def blocks(f, size=chunkSize):
+    "read a stream in blocks of data that finish on a newline"
+    rest = b''
+    while True:
+        data = f.read(size)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(b'\n') + 1
+        rest = data[end:]
+        if end:
+            yield data[:end]
+    if rest:
+        yield rest
+
+def boundary(data, offset):
+    "offset of the first line of data that starts at or after offset"
+    if offset <= 0:
+        return 0
+    end = data.find(b'\n', offset - 1)
+    return len(data) if end < 0 else end + 1
+
+def chunks(data, size=chunkSize, start=0, total=None):
+    """yield (start, end) ranges of data that finish on a newline, from
+start (which should be the start of a line) to total"""
+    total = len(data) if total is None else total
+    while start < total:
+        end = data.find(b'\n', start + size - 1) if start + size < total else -1
+        end = total if end < 0 else end + 1
+        yield start, end
+        start = end
+
+def lines(data, start, end):
+    "list of the lines in data[start:end] without line endings"
+    chunk = data[start:end]
+    result = [line.rstrip(b'\r') for line in chunk.split(b'\n')]
+    if chunk.endswith(b'\n'):
+        result.pop()
+    return result
+
+def size(f):
+    "size of an open file, or None when it is not a regular file"
+    st = os.fstat(f.fileno())
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st.st_size
+
+def read(f):
+    "list of all the lines of an open file"
+    data = mapFile(f)
+    if data is None:
+        return [line for block in blocks(f) for line in lines(block, 0, len(block))]
+    return lines(data, 0, len(data))
+
+def skip(f, count):
+    "read and discard count bytes of a stream"
+    while count > 0:
+        data = f.read(min(count, chunkSize))
+        if not data:
+            break
+        count -= len(data)
+
+def offsets(data, start, end):
+    "offsets in data of the lines of data[start:end], as given by lines"
+    result = []
+    while start < end:
+        result.append(start)
+        start = data.find(b'\n', start, end) + 1
+        if not start:
+            break
+    return result
+
+def line(data, offset):
+    "the line of data starting at offset, without line ending"
+    end = data.find(b'\n', offset)
+    return data[offset:len(data) if end < 0 else end].rstrip(b'\r')
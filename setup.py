@@ -46,6 +46,7 @@ setuptools.setup(
         "console_scripts": [
             "odd-hash = oddhash.main:main",
             "odd-crack = oddhash.crack:main",
+            "odd-bench = oddhash.bench:main",
         ]
     },
     install_requires=[